@@ -1,15 +1,54 @@
 import argparse
-from . import cli, gui
+import importlib
+import sys
+
+# Subcommands with their own arguments, and the modules with their main
+# functions. Front ends are only imported when they run, so that each one
+# loads its own dependencies and nothing else (the CLI never loads pygame).
+COMMANDS = {'bench': 'selfplay',
+            'dataset': 'dataset',
+            'endgame': 'endgame',
+            'headless': 'headless',
+            'serve': 'server'}
 
 
 def main(args):
-    if args['cli']:
-        cli.main(args['size'], args['win'])
+    profiler = None
+    if args['profile']:
+        from .profiling import Profiler
+        profiler = Profiler()
+    if args['ai']:
+        from . import ai
+        ai.main(args['size'], args['win'], args['depth'], args['think_time'],
+                profiler)
+    elif args['script']:
+        from . import cli
+        source = args['script']
+        try:
+            cli.run_script(source, sys.stdout, args['size'], args['win'],
+                           args['seed'], args['json'], args['trace'],
+                           profiler=profiler)
+        except (ValueError, OSError) as error:
+            sys.exit(f'ERROR: {error}')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+    elif args['cli']:
+        from . import cli
+        cli.main(args['size'], args['win'], profiler)
     else:
-        gui.main(args['size'], args['win'])
+        from . import gui
+        gui.main(args['size'], args['win'], profiler)
+    if profiler:
+        profiler.save(args['profile'])
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        module = importlib.import_module(f'.{COMMANDS[sys.argv[1]]}',
+                                         __package__)
+        module.main(sys.argv[2:])
+        sys.exit()
     parser = argparse.ArgumentParser(description='2048 game.')
     parser.add_argument('size', metavar='N', type=int, nargs='?',
                         default=4, help='NxN will be the size of the board')
@@ -17,5 +56,27 @@ if __name__ == '__main__':
                         default=2048, help='cell number needed to win')
     parser.add_argument('--cli', action='store_true',
                         help='run command-line version of the game')
+    parser.add_argument('--script', metavar='FILE',
+                        type=argparse.FileType('r'),
+                        help="play the actions of a file ('-' for stdin) "
+                             'without prompting')
+    parser.add_argument('--json', action='store_true',
+                        help='write scripted boards as JSON lines')
+    parser.add_argument('--trace', action='store_true',
+                        help='show the board after every scripted action')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of the scripted game')
+    parser.add_argument('--profile', metavar='FILE',
+                        help="write a JSON summary of game operation counts "
+                             "and timings when the game ends ('-' for "
+                             'stderr)')
+    parser.add_argument('--ai', action='store_true',
+                        help='let the expectimax AI play (4x4 boards only)')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='maximum search depth of the AI')
+    parser.add_argument('--think-time', type=float, default=None,
+                        help='time budget in seconds per AI move')
     args = parser.parse_args()
+    if args.ai and args.size != 4:
+        parser.error('the AI only plays 4x4 boards')
     main(vars(args))
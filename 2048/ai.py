@@ -0,0 +1,270 @@
+import time
+from collections import OrderedDict
+from . import bitboard as bb
+from . import spawn
+from .board import GameBoard, DIRECTIONS
+from .cli import print_gameboard
+
+
+class Heuristic:
+    """Board evaluation built from per-row scores.
+
+    Every row and column of a packed board is scored by a lookup table
+    that rewards blank cells, possible merges and monotonic rows, and
+    penalizes big numbers scattered around the board.
+    """
+
+    def __init__(self, empty=270.0, merges=700.0, monotonicity=47.0,
+                 monotonicity_power=4.0, sum_weight=11.0, sum_power=3.5,
+                 base=200000.0):
+        self.empty = empty
+        self.merges = merges
+        self.monotonicity = monotonicity
+        self.monotonicity_power = monotonicity_power
+        self.sum_weight = sum_weight
+        self.sum_power = sum_power
+        self.base = base
+        self._table = None
+
+    def __call__(self, state):
+        """Evaluates a packed board."""
+        if self._table is None:
+            self._table = [self.row_value([(row >> (4 * i)) & 0xF
+                                           for i in range(bb.SIZE)])
+                           for row in range(65536)]
+        table = self._table
+        transposed = bb.transpose(state)
+        value = 0.0
+        shift = 0
+        while shift < 64:
+            value += (table[(state >> shift) & bb.ROW_MASK]
+                      + table[(transposed >> shift) & bb.ROW_MASK])
+            shift += 16
+        return value
+
+    def row_value(self, cells):
+        """Scores a single row given as a list of exponents."""
+        empty = cells.count(0)
+        # Count the pairs of equal cells that would merge
+        merges = 0
+        previous = 0
+        streak = 0
+        for cell in cells:
+            if cell == 0:
+                continue
+            if cell == previous:
+                streak += 1
+            else:
+                if streak > 0:
+                    merges += 1 + streak
+                streak = 0
+                previous = cell
+        if streak > 0:
+            merges += 1 + streak
+        # Measure how far the row is from being monotonic
+        left = right = 0.0
+        for i in range(1, len(cells)):
+            before = cells[i - 1] ** self.monotonicity_power
+            after = cells[i] ** self.monotonicity_power
+            if cells[i - 1] > cells[i]:
+                left += before - after
+            else:
+                right += after - before
+        total = sum(cell ** self.sum_power for cell in cells)
+        return (self.base + self.empty * empty + self.merges * merges
+                - self.monotonicity * min(left, right)
+                - self.sum_weight * total)
+
+
+class TranspositionTable:
+    """Bounded cache of searched positions with least-recently-used eviction."""
+
+    def __init__(self, capacity=2**18):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, state, depth):
+        """Returns the value of a position searched at least as deep, if any."""
+        entry = self._entries.get(state)
+        if entry is not None and entry[0] >= depth:
+            self._entries.move_to_end(state)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, state, depth, value):
+        """Stores the value of a position, evicting the oldest if needed."""
+        self._entries[state] = (depth, value)
+        self._entries.move_to_end(state)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes every stored position."""
+        self._entries.clear()
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+
+class ExpectimaxPlayer:
+    """Chooses moves by expectimax search over packed 4x4 boards.
+
+    Player moves are maximized and cell spawns are averaged with their
+    probabilities. With a time budget, the search deepens iteratively and
+    keeps the result of the deepest search that finished in time.
+    """
+
+    def __init__(self, depth=3, heuristic=None, time_limit=None,
+                 cache_size=2**18, min_probability=1e-4,
+                 distribution=spawn.DISTRIBUTION):
+        self.depth = depth
+        self.heuristic = heuristic or Heuristic()
+        self.time_limit = time_limit
+        self.min_probability = min_probability
+        self.distribution = distribution
+        self.table = TranspositionTable(cache_size)
+        self.nodes = 0
+        self.moves = 0
+        self.search_time = 0.0
+        self._deadline = None
+
+    def choose(self, game: GameBoard):
+        """Returns the best direction for the game, or None if stuck."""
+        if game.size != bb.SIZE:
+            raise ValueError('The AI only plays 4x4 boards')
+        state = bb.pack(game.board)
+        start = time.perf_counter()
+        if self.time_limit is None:
+            self._deadline = None
+            best = self._search(state, self.depth)
+        else:
+            self._deadline = start + self.time_limit
+            best = None
+            depth = 1
+            while depth <= self.depth:
+                try:
+                    best = self._search(state, depth)
+                except SearchTimeout:
+                    break
+                depth += 1
+            if best is None:
+                # Not even one ply finished, just make any legal move
+                self._deadline = None
+                best = self._search(state, 1)
+        self.search_time += time.perf_counter() - start
+        self.moves += 1
+        return best
+
+    def play(self, game: GameBoard):
+        """Plays the game until it's won or lost."""
+        while not game.won() and not game.lost():
+            direction = self.choose(game)
+            if direction is None:
+                break
+            game.shift(direction)
+
+    def moves_per_second(self):
+        """Chosen moves per second of search time."""
+        return self.moves / self.search_time if self.search_time else 0.0
+
+    def nodes_per_second(self):
+        """Searched nodes per second of search time."""
+        return self.nodes / self.search_time if self.search_time else 0.0
+
+    def _search(self, state, depth):
+        """Returns the best direction after searching the given depth."""
+        best = None
+        best_value = -1.0
+        for direction, (vertical, reverse) in enumerate(DIRECTIONS):
+            new_state, _ = bb.move(state, vertical, reverse)
+            if new_state == state:
+                continue
+            value = self._expect(new_state, depth - 1, 1.0)
+            if value > best_value:
+                best = direction
+                best_value = value
+        return best
+
+    def _maximize(self, state, depth, probability):
+        """Value of a position where the player moves next."""
+        self.nodes += 1
+        best = 0.0
+        for vertical, reverse in DIRECTIONS:
+            new_state, _ = bb.move(state, vertical, reverse)
+            if new_state != state:
+                value = self._expect(new_state, depth - 1, probability)
+                if value > best:
+                    best = value
+        return best
+
+    def _expect(self, state, depth, probability):
+        """Value of a position where a new cell spawns next."""
+        self.nodes += 1
+        if depth <= 0 or probability < self.min_probability:
+            return self.heuristic(state)
+        if self._deadline is not None and self.nodes % 1024 == 0:
+            if time.perf_counter() > self._deadline:
+                raise SearchTimeout
+        value = self.table.get(state, depth)
+        if value is not None:
+            return value
+        empty = bb.empty_cells(state)
+        if not empty:
+            return self.heuristic(state)
+        value = 0.0
+        cell_probability = probability / len(empty)
+        for index in empty:
+            for number, chance in self.distribution:
+                new_state = bb.set_cell(state, index, number.bit_length() - 1)
+                value += chance * self._maximize(
+                    new_state, depth, cell_probability * chance)
+        value /= len(empty)
+        self.table.put(state, depth, value)
+        return value
+
+
+def main(size=4, win=2048, depth=3, time_limit=None, profiler=None):
+    game = GameBoard(size, win, bitboard=True)
+    if profiler:
+        profiler.attach(game)
+    player = ExpectimaxPlayer(depth=depth, time_limit=time_limit)
+    player.play(game)
+    print_gameboard(game)
+    print('The AI won!' if game.won() else 'The AI lost.')
+    print(f'{player.moves_per_second():.1f} moves/s, '
+          f'{player.nodes_per_second():.0f} nodes/s')
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    # The transposition table never grows past its capacity
+    table = TranspositionTable(capacity=3)
+    for state in range(5):
+        table.put(state, 1, float(state))
+    assert len(table) == 3
+    assert table.get(0, 1) is None and table.get(4, 1) == 4.0
+    assert table.get(4, 2) is None
+    # The only legal move of a stuck row is chosen
+    game = GameBoard(test=True)
+    game.board = bb.unpack(bb.pack([[2, 4, 2, 4],
+                                    [4, 2, 4, 2],
+                                    [2, 4, 2, 4],
+                                    [4, 2, 4, 0]]))
+    player = ExpectimaxPlayer(depth=2)
+    assert player.choose(game) in (1, 3)
+    # A time budget bounds the search
+    game = GameBoard(seed=1)
+    player = ExpectimaxPlayer(depth=8, time_limit=0.05)
+    player.heuristic(0)
+    start = time.perf_counter()
+    assert player.choose(game) is not None
+    assert time.perf_counter() - start < 0.5
+    print('All tests passed.')
@@ -0,0 +1,211 @@
+import random as rd
+import time
+import numpy as np
+from . import spawn
+from .board import GameBoard, DIRECTIONS, legal_moves, shift_rows
+
+
+class BatchBoard:
+    """Many game boards advanced together with array operations.
+
+    Boards are kept in a single (count, size, size) array. Every game
+    spawns cells with its own seeded generator, so a game of a batch
+    plays exactly like a GameBoard created with the same seed and given
+    the same moves.
+    """
+
+    def __init__(self, count, size=4, win=2048, seeds=None, test=False,
+                 distribution=spawn.DISTRIBUTION):
+        self.count = count
+        self.size = size
+        self.win = win
+        self.board = np.zeros((count, size, size), dtype=np.int64)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.moves = np.zeros(count, dtype=np.int64)
+        self.test_mode = test
+        self.distribution = spawn.check_distribution(distribution)
+        if seeds is None:
+            seeds = [rd.getrandbits(64) for i in range(count)]
+        if len(seeds) != count:
+            raise ValueError(f'Expected {count} seeds, got {len(seeds)}')
+        self._spawn_state = np.array([seed & spawn.MASK64 for seed in seeds],
+                                     dtype=np.uint64)
+        self._add_new_cells(np.ones(count, dtype=bool))
+
+    def reset(self, games, seeds):
+        """Starts new games in some of the boards.
+
+        Args:
+            games: Indices of the boards.
+            seeds: Seed of the new game of each board.
+        """
+        self.board[games] = 0
+        self.score[games] = 0
+        self.moves[games] = 0
+        self._spawn_state[games] = [seed & spawn.MASK64 for seed in seeds]
+        mask = np.zeros(self.count, dtype=bool)
+        mask[games] = True
+        self._add_new_cells(mask)
+
+    def is_full(self):
+        """Determines which boards are full."""
+        return self.board.min(axis=(1, 2)) > 0
+
+    def won(self):
+        """Determines which games have been won."""
+        return self.board.max(axis=(1, 2)) == self.win
+
+    def lost(self):
+        """Determines which games have been lost."""
+        return ~self.won() & self.is_full() & self._no_moves_left()
+
+    def done(self):
+        """Determines which games have finished, either won or lost."""
+        return self.won() | self.lost()
+
+    def shift(self, directions):
+        """Shifts each board in its own direction.
+
+        Args:
+            directions: One direction (LEFT, RIGHT, UP or DOWN) per game.
+                Games given any other value, like -1, are left as they are.
+
+        Returns:
+            Boolean array telling which boards actually moved.
+        """
+        directions = np.asarray(directions)
+        new_board = self.board.copy()
+        gained = np.zeros(self.count, dtype=np.int64)
+        for direction, (vertical, reverse) in enumerate(DIRECTIONS):
+            games = np.flatnonzero(directions == direction)
+            if len(games) == 0:
+                continue
+            # Orient the boards so that the shift is always leftward
+            boards = self.board[games]
+            if vertical:
+                boards = boards.transpose(0, 2, 1)
+            if reverse:
+                boards = boards[:, :, ::-1]
+            rows, merged, merged_rows = shift_rows(
+                boards.reshape(-1, self.size))
+            boards = rows.reshape(-1, self.size, self.size)
+            # Restore the original orientation
+            if reverse:
+                boards = boards[:, :, ::-1]
+            if vertical:
+                boards = boards.transpose(0, 2, 1)
+            new_board[games] = boards
+            gained[games] = np.bincount(merged_rows // self.size,
+                                        weights=merged, minlength=len(games))
+        moved = (new_board != self.board).any(axis=(1, 2))
+        self.board = new_board
+        self.score += gained
+        self.moves += moved
+        self._add_new_cells(moved)
+        return moved
+
+    def legal_moves(self):
+        """Determines which directions would change each board.
+
+        Returns:
+            Boolean array shaped (count, 4), indexed by direction.
+        """
+        return legal_moves(self.board)
+
+    def _add_new_cells(self, games):
+        """Adds a 2 or 4 in a blank cell of each of the given boards."""
+        if self.test_mode:
+            return
+        games = np.flatnonzero(games & ~self.is_full())
+        if len(games) == 0:
+            return
+        empty = self.board[games].reshape(len(games), -1) == 0
+        self._spawn_state[games], output = spawn.splitmix64_array(
+            self._spawn_state[games])
+        position, value = spawn.pick(output, empty.sum(axis=1),
+                                     self.distribution)
+        # Index of the chosen blank cell, counting in row-major order
+        cells = np.argmax(empty.cumsum(axis=1) > position[:, None], axis=1)
+        self.board[games, cells // self.size, cells % self.size] = value
+
+    def _no_moves_left(self):
+        """Determines which boards don't have any possible move."""
+        return ~self.legal_moves().any(axis=1)
+
+
+def run(batch, policy, max_moves=None):
+    """Plays every game of a batch until it finishes.
+
+    Args:
+        batch: BatchBoard to play.
+        policy: Function that takes the batch and returns one direction
+            per game.
+        max_moves: Optional limit of shifts per game.
+
+    Returns:
+        The number of games finished per second. Games cut short by
+        max_moves aren't counted.
+    """
+    start = time.perf_counter()
+    done = batch.done()
+    steps = 0
+    while not done.all() and (max_moves is None or steps < max_moves):
+        batch.shift(np.where(done, -1, policy(batch)))
+        done = batch.done()
+        steps += 1
+    return int(done.sum()) / (time.perf_counter() - start)
+
+
+def random_policy(seed=None):
+    """Creates a policy that picks uniformly random directions."""
+    rng = np.random.default_rng(seed)
+    return lambda batch: rng.integers(0, len(DIRECTIONS), batch.count)
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    # Play the same seeded games with a batch and with single boards
+    seeds = list(range(50))
+    batch = BatchBoard(len(seeds), seeds=seeds)
+    games = [GameBoard(seed=seed) for seed in seeds]
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        directions = rng.integers(0, 4, len(seeds))
+        moved = batch.shift(directions)
+        legal = batch.legal_moves()
+        for i, game in enumerate(games):
+            previous_moves = game.moves
+            game.shift(directions[i])
+            assert moved[i] == (game.moves > previous_moves)
+            assert np.array_equal(legal[i], game.legal_moves())
+    for i, game in enumerate(games):
+        assert np.array_equal(batch.board[i], game.board)
+        assert batch.score[i] == game.score
+        assert batch.moves[i] == game.moves
+        assert batch.lost()[i] == game.lost()
+        assert batch.won()[i] == game.won()
+    # Reset boards start the same games as new ones
+    batch.reset([3, 7], [100, 101])
+    for i, seed in ((3, 100), (7, 101)):
+        assert np.array_equal(batch.board[i], GameBoard(seed=seed).board)
+        assert batch.score[i] == batch.moves[i] == 0
+    # Merges run right-to-left on rightward shifts
+    batch = BatchBoard(1, test=True, seeds=[0])
+    batch.board[0] = np.array([[2, 2, 2, 0],
+                               [4, 4, 4, 4],
+                               [0, 0, 0, 0],
+                               [8, 0, 8, 2]])
+    batch.shift([1])
+    assert np.array_equal(batch.board[0], np.array([[0, 0, 2, 4],
+                                                    [0, 0, 8, 8],
+                                                    [0, 0, 0, 0],
+                                                    [0, 0, 16, 2]]))
+    assert batch.score[0] == 36
+    # Games stopped by the move limit don't count as finished
+    assert run(BatchBoard(20, seeds=list(range(20))), random_policy(0),
+               max_moves=5) == 0
+    # Measure throughput
+    batch = BatchBoard(2000, seeds=list(range(2000)))
+    rate = run(batch, random_policy(0))
+    print(f'Random play: {rate:.0f} games/s')
+    print('All tests passed.')
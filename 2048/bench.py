@@ -0,0 +1,231 @@
+import argparse
+import json
+import platform
+import random as rd
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from .board import GameBoard, DIRECTIONS
+
+# GameBoard options of each engine, and the sizes it supports
+ENGINES = {'numpy': ({}, None),
+           'compact': ({'compact': True}, None),
+           'bitboard': ({'bitboard': True}, (4,))}
+SIZES = (4, 8, 16, 64)
+# Timed calls per operation, by board size
+REPEAT = {4: 2000, 8: 1000, 16: 300, 64: 30}
+# Moves played by each playout, by board size (None plays until lost)
+PLAYOUT_MOVES = {4: None, 8: 2000, 16: 500, 64: 100}
+# Slowdown reported as a regression when comparing results
+THRESHOLD = 1.1
+
+
+def random_layout(size, density, seed):
+    """Creates a board with random small numbers in some of its cells."""
+    rng = np.random.default_rng(seed)
+    exponents = rng.integers(1, 8, (size, size))
+    exponents[rng.random((size, size)) > density] = 0
+    return np.where(exponents > 0, 2**exponents, 0)
+
+
+def stuck_layout(size):
+    """Creates a full board where no cell is next to an equal one."""
+    return np.fromfunction(lambda x, y: 2**(1 + (x + 2 * y) % 6),
+                           (size, size), dtype=int)
+
+
+def measure(setup, operation, repeat):
+    """Times an operation and measures the memory it allocates.
+
+    Args:
+        setup: Function called before every call of the operation,
+            outside of the measurements.
+        operation: Function to measure.
+        repeat: Number of calls.
+
+    Returns:
+        A dict with the mean and minimum time per call in microseconds,
+        the mean and maximum peak of memory allocated by a call, in bytes,
+        and the mean number of memory blocks and bytes still allocated
+        when a call returns, from the difference of snapshots taken
+        around it. Memory allocated and freed within the call only shows
+        in the peak.
+    """
+    # Warm up caches and lookup tables first
+    setup()
+    operation()
+    times = []
+    for i in range(repeat):
+        setup()
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+    # Measure memory separately, since tracing slows everything down
+    peaks = []
+    blocks = []
+    retained = []
+    # Leave out the memory of the snapshots themselves
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    for i in range(min(repeat, 100)):
+        setup()
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        operation()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        stats = (tracemalloc.take_snapshot().filter_traces(filters)
+                 .compare_to(snapshot, 'filename'))
+        blocks.append(sum(max(stat.count_diff, 0) for stat in stats))
+        retained.append(sum(max(stat.size_diff, 0) for stat in stats))
+    tracemalloc.stop()
+    return {'mean_us': 1e6 * float(np.mean(times)),
+            'min_us': 1e6 * float(np.min(times)),
+            'mean_peak_bytes': float(np.mean(peaks)),
+            'max_peak_bytes': int(np.max(peaks)),
+            'mean_retained_blocks': float(np.mean(blocks)),
+            'mean_retained_bytes': float(np.mean(retained))}
+
+
+def bench_board(size, options, seed=0):
+    """Benchmarks the operations of a board of the given size."""
+    repeat = REPEAT.get(size, 30)
+    results = {}
+    layout = random_layout(size, 0.6, seed)
+    game = GameBoard(size, test=True, **options)
+
+    def set_layout():
+        game.board = layout.copy()
+
+    for name, (vertical, reverse) in zip(('left', 'right', 'up', 'down'),
+                                         DIRECTIONS):
+        results[f'shift_{name}'] = measure(
+            set_layout, lambda: game._shift(vertical, reverse), repeat)
+
+    stuck = GameBoard(size, test=True, **options)
+    stuck.board = stuck_layout(size)
+
+    def forget_moves():
+        stuck._movable = None
+
+    results['no_moves_left'] = measure(forget_moves, stuck._no_moves_left,
+                                       repeat)
+    results['legal_moves'] = measure(set_layout, game.legal_moves, repeat)
+
+    spawning = GameBoard(size, seed=seed, **options)
+
+    def set_spawning_layout():
+        spawning.board = layout.copy()
+
+    results['add_new_cell'] = measure(set_spawning_layout,
+                                      spawning._add_new_cell, repeat)
+
+    def make_move():
+        spawning.board = layout.copy()
+        for direction in range(len(DIRECTIONS)):
+            spawning.shift(direction)
+            if spawning.can_undo:
+                break
+
+    results['undo'] = measure(make_move, spawning.undo, repeat)
+    results['playout'] = bench_playout(size, options, seed)
+    return results
+
+
+def bench_playout(size, options, seed=0, games=5):
+    """Times whole games of random moves."""
+    limit = PLAYOUT_MOVES.get(size)
+    rng = rd.Random(seed)
+    moves = 0
+    start = time.perf_counter()
+    for i in range(games):
+        game = GameBoard(size, win=1 << 62, seed=seed + i, **options)
+        while not game.lost() and (limit is None or game.moves < limit):
+            game.shift(rng.randrange(len(DIRECTIONS)))
+        moves += game.moves
+    elapsed = time.perf_counter() - start
+    return {'games': games,
+            'moves': moves,
+            'moves_per_second': moves / elapsed,
+            'games_per_second': games / elapsed}
+
+
+def run(sizes=SIZES, engines=ENGINES.keys(), seed=0):
+    """Runs the whole suite and returns its results."""
+    results = {'meta': metadata(), 'results': {}}
+    for engine in engines:
+        options, supported = ENGINES[engine]
+        for size in sizes:
+            if supported and size not in supported:
+                continue
+            key = f'{engine}/{size}x{size}'
+            print(f'Running {key}...', file=sys.stderr)
+            results['results'][key] = bench_board(size, options, seed)
+    return results
+
+
+def metadata():
+    """Describes the environment the benchmarks ran in."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(old, new, threshold=THRESHOLD):
+    """Lists the operations that got slower between two runs.
+
+    Returns:
+        A list of (benchmark, operation, old time, new time) tuples.
+    """
+    regressions = []
+    for key, operations in new['results'].items():
+        for name, result in operations.items():
+            previous = old['results'].get(key, {}).get(name)
+            if previous is None or 'mean_us' not in result:
+                continue
+            if result['mean_us'] > threshold * previous['mean_us']:
+                regressions.append((key, name, previous['mean_us'],
+                                    result['mean_us']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m 2048.bench',
+        description='Benchmark the game board operations.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='board sizes to benchmark')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES.keys(),
+                        default=list(ENGINES.keys()),
+                        help='board engines to benchmark')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the boards and games')
+    parser.add_argument('--output', '-o', type=argparse.FileType('w'),
+                        default=sys.stdout, help='JSON file for the results')
+    parser.add_argument('--compare', type=argparse.FileType('r'),
+                        help='JSON results of a previous run to compare to')
+    args = parser.parse_args(argv)
+    results = run(args.sizes, args.engines, args.seed)
+    json.dump(results, args.output, indent=2)
+    args.output.write('\n')
+    if args.compare:
+        regressions = compare(json.load(args.compare), results)
+        for key, name, old, new in regressions:
+            print(f'REGRESSION {key} {name}: {old:.1f} us -> {new:.1f} us',
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
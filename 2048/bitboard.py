@@ -0,0 +1,199 @@
+import numpy as np
+
+# A 4x4 board is packed into a 64-bit integer. Each cell takes 4 bits
+# holding the base-2 logarithm of its number (0 means blank), so cell
+# (row, col) lives at bit offset 4 * (4 * row + col). Rows are 16-bit
+# chunks with their leftmost cell in the lowest nibble.
+SIZE = 4
+ROW_MASK = 0xFFFF
+MAX_EXPONENT = 15
+
+# Row move lookup tables, built on first use
+_tables = None
+
+
+def pack(board):
+    """Packs a 4x4 array of cell numbers into a 64-bit integer.
+
+    Raises:
+        ValueError: A number is too big to fit in a cell.
+    """
+    state = 0
+    shift = 0
+    for cell in np.asarray(board).ravel():
+        if cell:
+            exponent = int(cell).bit_length() - 1
+            if exponent > MAX_EXPONENT:
+                raise ValueError(f'{cell} is too big for a 4x4 bitboard')
+            state |= exponent << shift
+        shift += 4
+    return state
+
+
+def unpack(state):
+    """Unpacks a 64-bit integer into a 4x4 array of cell numbers."""
+    board = np.zeros((SIZE, SIZE), dtype=np.int64)
+    cells = board.ravel()
+    i = 0
+    while state:
+        exponent = state & 0xF
+        if exponent:
+            cells[i] = 1 << exponent
+        state >>= 4
+        i += 1
+    return board
+
+
+def transpose(state):
+    """Swaps the rows and columns of a packed board."""
+    a1 = state & 0xF0F00F0FF0F00F0F
+    a2 = state & 0x0000F0F00000F0F0
+    a3 = state & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def mirror(state):
+    """Reverses the order of the cells of every row of a packed board."""
+    mirrored = 0
+    shift = 0
+    while shift < 64:
+        mirrored |= _reverse_row((state >> shift) & ROW_MASK) << shift
+        shift += 16
+    return mirrored
+
+
+def flip(state):
+    """Reverses the order of the rows of a packed board."""
+    return (((state & ROW_MASK) << 48) | (((state >> 16) & ROW_MASK) << 32)
+            | (((state >> 32) & ROW_MASK) << 16) | (state >> 48))
+
+
+def move(state, vertical: bool, reverse: bool):
+    """Shifts a packed board in the given direction.
+
+    Args:
+        state: Packed board.
+        vertical: If true, shifts columns instead of rows.
+        reverse: If true, shifts rightward or downward instead of
+            leftward or upward.
+
+    Returns:
+        A tuple with the new packed board and the score gained.
+    """
+    left, right, scores = _get_tables()
+    table = right if reverse else left
+    if vertical:
+        state = transpose(state)
+    new_state = 0
+    score = 0
+    shift = 0
+    while shift < 64:
+        row = (state >> shift) & ROW_MASK
+        new_state |= table[row] << shift
+        score += scores[row]
+        shift += 16
+    if vertical:
+        new_state = transpose(new_state)
+    return new_state, score
+
+
+def empty_cells(state):
+    """Returns the indices (row * 4 + col) of the blank cells."""
+    return [i for i in range(SIZE * SIZE) if not (state >> (4 * i)) & 0xF]
+
+
+def count_empty(state):
+    """Counts the blank cells of a packed board."""
+    count = 0
+    for i in range(SIZE * SIZE):
+        if not (state >> (4 * i)) & 0xF:
+            count += 1
+    return count
+
+
+def max_exponent(state):
+    """Returns the exponent of the biggest cell of a packed board."""
+    highest = 0
+    while state:
+        if state & 0xF > highest:
+            highest = state & 0xF
+        state >>= 4
+    return highest
+
+
+def set_cell(state, index, exponent):
+    """Returns the packed board with a cell set to the given exponent."""
+    shift = 4 * index
+    return (state & ~(0xF << shift)) | (exponent << shift)
+
+
+def has_moves(state):
+    """Determines if any shift would change the packed board."""
+    left, right, _ = _get_tables()
+    transposed = transpose(state)
+    shift = 0
+    while shift < 64:
+        row = (state >> shift) & ROW_MASK
+        column = (transposed >> shift) & ROW_MASK
+        if (left[row] != row or right[row] != row
+                or left[column] != column or right[column] != column):
+            return True
+        shift += 16
+    return False
+
+
+def _get_tables():
+    """Returns the row move tables, building them if needed."""
+    global _tables
+    if _tables is None:
+        _tables = _build_tables()
+    return _tables
+
+
+def _build_tables():
+    """Precomputes the result of shifting every possible row.
+
+    Returns:
+        Three lists indexed by packed row: the row shifted leftward,
+        the row shifted rightward and the score gained by either shift.
+    """
+    left = [0] * 65536
+    right = [0] * 65536
+    scores = [0] * 65536
+    for row in range(65536):
+        cells = [(row >> (4 * i)) & 0xF for i in range(SIZE)]
+        # Merge leftward, the same way GameBoard._reduce does
+        compressed = [cell for cell in cells if cell]
+        reduced = []
+        score = 0
+        i = 0
+        while i < len(compressed):
+            if (i < len(compressed) - 1
+                    and compressed[i] == compressed[i + 1]
+                    and compressed[i] < MAX_EXPONENT):
+                reduced.append(compressed[i] + 1)
+                score += 1 << (compressed[i] + 1)
+                i += 2
+            else:
+                reduced.append(compressed[i])
+                i += 1
+        result = 0
+        for j, cell in enumerate(reduced):
+            result |= cell << (4 * j)
+        left[row] = result
+        scores[row] = score
+    # A rightward shift is a leftward shift of the mirrored row, and
+    # merges the same runs of equal cells, so it scores the same
+    for row in range(65536):
+        right[row] = _reverse_row(left[_reverse_row(row)])
+    return left, right, scores
+
+
+def _reverse_row(row):
+    """Mirrors the cells of a packed row."""
+    return (((row & 0xF) << 12) | ((row & 0xF0) << 4)
+            | ((row >> 4) & 0xF0) | ((row >> 12) & 0xF))
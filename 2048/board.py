@@ -1,21 +1,305 @@
 import random as rd
+import struct
 import numpy as np
+from . import bitboard as bb
+from . import spawn
+from .history import History, Step
+
+# Shift directions, as (vertical, reverse) arguments of GameBoard._shift
+LEFT, RIGHT, UP, DOWN = range(4)
+DIRECTIONS = ((False, False), (False, True), (True, False), (True, True))
+# Boards at least this big are shifted with the vectorized kernel
+VECTOR_SIZE = 12
+# A snapshot made by GameBoard.to_bytes starts with SNAPSHOT_MAGIC and a
+# SNAPSHOT_HEADER with the size, win number, seed, spawner state, score,
+# moves, engine flags, history capacity (UNLIMITED if it has none) and the
+# number of undo steps, redo steps and spawn distribution entries. Then
+# come the distribution entries, the base 2 logarithms of the cells, one
+# byte each, and the steps: the undo ones, oldest first, followed by the
+# redo ones, next to redo last. Each step is a STEP_HEADER with the
+# scores, the logarithms of the biggest cells and the number of changed
+# cells, followed by the packed boards (bitboard engine) or by the changed
+# cell indices as uint32 and their logarithms before and after.
+SNAPSHOT_MAGIC = b'2048SNP\x01'
+SNAPSHOT_HEADER = struct.Struct('<HQQQQQBIIIB')
+DISTRIBUTION_ENTRY = struct.Struct('<Qd')
+STEP_HEADER = struct.Struct('<QQBBI')
+BITBOARD_STEP = struct.Struct('<QQ')
+# Engine flags of a snapshot
+BITBOARD, COMPACT, TEST = 1, 2, 4
+# History capacity of a snapshot with unlimited undo
+UNLIMITED = 0xFFFFFFFF
+
+
+def shift_rows(rows, exponents=False):
+    """Shifts every row of a 2D array leftward, merging equal cells.
+
+    All the rows are handled at once: the numbers are gathered in
+    row-major order, equal neighbors in the same row are paired from the
+    left, so that each number merges at most once, and the result is
+    scattered back into a blank array.
+
+    Args:
+        rows: 2D array of cell numbers.
+        exponents: If true, rows holds the base 2 logarithms of the
+            numbers instead, so merging adds one instead of doubling.
+
+    Returns:
+        A tuple with the shifted rows, the cells created by merges (in the
+        same form as rows) and the index of the row of each of them.
+    """
+    height, width = rows.shape
+    flat = rows.ravel()
+    cells = np.flatnonzero(flat != 0)
+    if len(cells) == 0:
+        return (np.zeros_like(rows), np.zeros(0, dtype=rows.dtype),
+                np.zeros(0, dtype=np.int64))
+    values = flat[cells]
+    row = cells // width
+    # Consecutive numbers of a row that are equal can merge, but inside a
+    # run of equal numbers they pair up from the left, so only the pairs
+    # that start at an even position of the run merge
+    same = (values[1:] == values[:-1]) & (row[1:] == row[:-1])
+    index = np.arange(len(values))
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = ~same
+    run_start = np.maximum.accumulate(np.where(starts, index, 0))
+    merge = same & ((index[:-1] - run_start[:-1]) % 2 == 0)
+    # Both numbers of a merged pair become their sum and end up in the
+    # same cell
+    if exponents:
+        increase = merge.astype(values.dtype)
+    else:
+        increase = values[:-1] * merge
+    new_values = values.copy()
+    new_values[:-1] += increase
+    new_values[1:] += increase
+    # Every merge moves the following numbers of the row one cell left
+    merges = np.zeros(len(values), dtype=np.int64)
+    np.cumsum(merge, out=merges[1:])
+    shifted = index - merges
+    counts = np.count_nonzero(rows, axis=1)
+    first = np.minimum(np.cumsum(counts) - counts, len(values) - 1)
+    position = shifted - np.repeat(shifted[first], counts)
+    new_rows = np.zeros_like(flat)
+    new_rows[row * width + position] = new_values
+    merged = np.flatnonzero(merge)
+    return new_rows.reshape(height, width), new_values[merged], row[merged]
+
+
+def legal_moves(boards):
+    """Determines which directions would change each board.
+
+    A shift changes a row when a number has a blank cell in front of it or
+    an equal neighbor, so every direction is answered by comparing the
+    boards with themselves moved by one cell.
+
+    Args:
+        boards: Array of one or more square boards, shaped (..., N, N).
+
+    Returns:
+        Boolean array shaped (..., 4), indexed by direction.
+    """
+    boards = np.asarray(boards)
+    filled = boards != 0
+    # Equal neighbors can be merged in both directions of their axis
+    rows = ((boards[..., :, 1:] == boards[..., :, :-1])
+            & filled[..., :, 1:]).any(axis=(-2, -1))
+    columns = ((boards[..., 1:, :] == boards[..., :-1, :])
+               & filled[..., 1:, :]).any(axis=(-2, -1))
+    # A number slides into a blank cell next to it
+    left = (filled[..., :, 1:] & ~filled[..., :, :-1]).any(axis=(-2, -1))
+    right = (filled[..., :, :-1] & ~filled[..., :, 1:]).any(axis=(-2, -1))
+    up = (filled[..., 1:, :] & ~filled[..., :-1, :]).any(axis=(-2, -1))
+    down = (filled[..., :-1, :] & ~filled[..., 1:, :]).any(axis=(-2, -1))
+    return np.stack([left | rows, right | rows, up | columns,
+                     down | columns], axis=-1)
+
+
+def to_exponents(board):
+    """Converts cell numbers to their base 2 logarithms (0 if blank)."""
+    board = np.asarray(board, dtype=np.int64)
+    exponents = np.zeros(board.shape, dtype=np.uint8)
+    filled = board > 0
+    exponents[filled] = np.log2(board[filled])
+    return exponents
+
+
+def to_numbers(exponents):
+    """Converts base 2 logarithms of cells back to cell numbers."""
+    exponents = np.asarray(exponents, dtype=np.int64)
+    return np.where(exponents > 0, 1 << exponents, 0)
+
 
 class GameBoard:
     """Model/controller of the game board state and actions."""
 
-    def __init__(self, size=4, win=2048, test=False):
+    def __init__(self, size=4, win=2048, test=False, bitboard=False,
+                 seed=None, spawner=None, recorder=None, history_size=None,
+                 compact=False, cache=None):
         self.size = size
         self.win = win
-        self.board = np.zeros((size, size), dtype=np.int)
-        self.previous_board = self.board.copy()
+        # The bitboard engine only handles 4x4 boards, other sizes
+        # always use the NumPy one
+        self.bitboard = bitboard and size == bb.SIZE
+        self._bits = 0
+        # The compact NumPy engine stores the base 2 logarithm of every
+        # cell in a byte instead of the number itself
+        self.compact = compact and not self.bitboard
+        # Unpacked bitboard, until the next change
+        self._board_cache = None
+        # Optional PositionCache shared with other games, used to look up
+        # the shifts of the NumPy engines
+        self.cache = cache
+        # Undo/redo steps, up to history_size of them (unlimited if None)
+        self.history = History(history_size)
+        # Number of blank cells, biggest cell and whether any move is
+        # possible (None if unknown), kept up to date on every change
+        self._empty = size * size
+        self._max = 0
+        self._movable = None
+        self.board = np.zeros((size, size), dtype=np.int64)
         self.score = 0
-        self.previous_score = 0
         self.moves = 0
-        self.can_undo = False
         self.test_mode = test
-        self._add_new_cell()
+        # Games are always seeded, so any of them can be reproduced
+        self.seed = rd.getrandbits(64) if seed is None else seed
+        self.spawner = spawner or spawn.SeededSpawner(self.seed)
+        # Optional replay writer notified of every move
+        self.recorder = recorder
+        cell = self._add_new_cell()
+        if self.recorder:
+            self.recorder.start(self, cell)
     
+    @classmethod
+    def load(cls, path):
+        """Creates a game from a snapshot file written by save."""
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+    def save(self, path):
+        """Writes a snapshot of the game to a file."""
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Creates a game from a snapshot made by to_bytes.
+
+        Raises:
+            ValueError: The data isn't a supported snapshot.
+        """
+        if bytes(data[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError('Not a game snapshot')
+        (size, win, seed, state, score, moves, flags, capacity, done,
+         undone, entries) = SNAPSHOT_HEADER.unpack_from(data,
+                                                        len(SNAPSHOT_MAGIC))
+        offset = len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+        distribution = []
+        for i in range(entries):
+            distribution.append(DISTRIBUTION_ENTRY.unpack_from(data, offset))
+            offset += DISTRIBUTION_ENTRY.size
+        spawner = spawn.SeededSpawner(seed, tuple(distribution))
+        spawner.state = state
+        # Created in test mode so that no cell is added
+        if capacity == UNLIMITED:
+            capacity = None
+        game = cls(size, win, test=True, bitboard=bool(flags & BITBOARD),
+                   seed=seed, spawner=spawner, history_size=capacity,
+                   compact=bool(flags & COMPACT))
+        game.test_mode = bool(flags & TEST)
+        cells = np.frombuffer(data, np.uint8, size * size, offset)
+        game.board = to_numbers(cells.reshape(size, size))
+        offset += size * size
+        game.score = score
+        game.moves = moves
+        steps = []
+        for i in range(done + undone):
+            step, offset = game._read_step(data, offset)
+            steps.append(step)
+        game.history.restore(steps[:done], steps[done:])
+        return game
+
+    def to_bytes(self):
+        """Makes a compact binary snapshot of the whole game.
+
+        The snapshot holds the board, score, moves, undo/redo history, win
+        number and spawner state, so that the game continues exactly the
+        same way when restored. Recorders and caches aren't included.
+
+        Raises:
+            ValueError: The game doesn't use a SeededSpawner, whose state
+                can't be saved.
+        """
+        if type(self.spawner) is not spawn.SeededSpawner:
+            raise ValueError('Only games with a SeededSpawner can be saved')
+        done, undone = self.history.steps()
+        capacity = self.history.capacity
+        distribution = self.spawner.distribution
+        flags = ((BITBOARD if self.bitboard else 0)
+                 | (COMPACT if self.compact else 0)
+                 | (TEST if self.test_mode else 0))
+        parts = [SNAPSHOT_MAGIC,
+                 SNAPSHOT_HEADER.pack(self.size, self.win,
+                                      self.seed & spawn.MASK64,
+                                      self.spawner.state, self.score,
+                                      self.moves, flags,
+                                      UNLIMITED if capacity is None
+                                      else capacity,
+                                      len(done), len(undone),
+                                      len(distribution))]
+        for number, probability in distribution:
+            parts.append(DISTRIBUTION_ENTRY.pack(number, probability))
+        parts.append((self._board if self.compact
+                      else to_exponents(self.board)).tobytes())
+        for step in done + undone:
+            parts.extend(self._write_step(step))
+        return b''.join(parts)
+
+    def _write_step(self, step: Step):
+        """Encodes an undo/redo step of a snapshot."""
+        count = 0 if step.cells is None else len(step.cells)
+        parts = [STEP_HEADER.pack(step.score_before, step.score_after,
+                                  max(int(step.max_before).bit_length() - 1, 0),
+                                  max(int(step.max_after).bit_length() - 1, 0),
+                                  count)]
+        if step.cells is None:
+            parts.append(BITBOARD_STEP.pack(step.before, step.after))
+        else:
+            parts.append(step.cells.astype(np.uint32).tobytes())
+            for cells in (step.before, step.after):
+                if not self.compact:
+                    cells = to_exponents(cells)
+                parts.append(cells.astype(np.uint8).tobytes())
+        return parts
+
+    def _read_step(self, data, offset):
+        """Decodes an undo/redo step of a snapshot.
+
+        Returns:
+            The step and the offset of the data that follows it.
+        """
+        score_before, score_after, max_before, max_after, count = \
+            STEP_HEADER.unpack_from(data, offset)
+        offset += STEP_HEADER.size
+        max_before = 1 << max_before if max_before else 0
+        max_after = 1 << max_after if max_after else 0
+        if self.bitboard:
+            before, after = BITBOARD_STEP.unpack_from(data, offset)
+            return (Step(None, before, after, score_before, score_after,
+                         max_before, max_after),
+                    offset + BITBOARD_STEP.size)
+        cells = np.frombuffer(data, np.uint32, count, offset).astype(np.int64)
+        offset += 4 * count
+        before = np.frombuffer(data, np.uint8, count, offset).copy()
+        after = np.frombuffer(data, np.uint8, count, offset + count).copy()
+        if not self.compact:
+            before = to_numbers(before)
+            after = to_numbers(after)
+        return (Step(cells, before, after, score_before, score_after,
+                     max_before, max_after),
+                offset + 2 * count)
+
     def get_score(self):
         """Returns score in human-friendly format."""
         if self.score >= 10**6:
@@ -24,14 +308,81 @@ class GameBoard:
             return f'{round(self.score / 10**3, 1)}k pts'
         else:
             return f'{self.score} pts'
+
+    @property
+    def board(self):
+        """Current board as a read-only array of cell numbers.
+
+        The game tracks its blank cells and biggest number, so changes
+        have to assign a new board instead of editing this one. With the
+        bitboard and compact engines, the array is converted on demand.
+        Compact boards are converted on every read, so that games don't
+        keep an int64 copy of them.
+        """
+        if self.bitboard:
+            if self._board_cache is None:
+                self._board_cache = bb.unpack(self._bits)
+                self._board_cache.flags.writeable = False
+            return self._board_cache
+        if self.compact:
+            board = to_numbers(self._board)
+        else:
+            board = self._board.view()
+        board.flags.writeable = False
+        return board
+
+    @board.setter
+    def board(self, board):
+        if self.bitboard:
+            # Pack before anything changes, in case the board doesn't fit
+            bits = bb.pack(board)
+        # The undo history doesn't apply to a different board
+        self.history.clear()
+        if self.bitboard:
+            self._bits = bits
+        elif self.compact:
+            self._board = to_exponents(board)
+        else:
+            # Keep a copy, since moves change the board in place
+            self._board = np.array(board, dtype=np.int64)
+        self._board_cache = None
+        self._sync_status()
+
+    @property
+    def previous_board(self):
+        """Board before the last move, as an array of cell numbers."""
+        step = self.history.last()
+        if step is None:
+            return self.board.copy()
+        if self.bitboard:
+            return bb.unpack(step.before)
+        board = self._board.copy()
+        board.flat[step.cells] = step.before
+        return to_numbers(board) if self.compact else board
+
+    @property
+    def previous_score(self):
+        """Score before the last move."""
+        step = self.history.last()
+        return self.score if step is None else step.score_before
+
+    @property
+    def can_undo(self):
+        """Determines if there's a move to undo."""
+        return len(self.history) > 0
+
+    @property
+    def can_redo(self):
+        """Determines if there's an undone move to redo."""
+        return self.history.redo_count > 0
         
     def is_full(self):
         """Determines if the board is full."""
-        return self.board.min() > 0
+        return self._empty == 0
     
     def won(self):
         """Determines if the game has been won."""
-        return self.board.max() == self.win
+        return self._max == self.win
     
     def lost(self):
         """Determines if the game has been lost."""
@@ -40,11 +391,35 @@ class GameBoard:
     def undo(self):
         """Returns the game to its previous state, if possible."""
         if self.can_undo:
-            self.board = self.previous_board.copy()
-            self.score = self.previous_score + 0
+            self._restore(self.history.undo(), before=True)
             self.moves -= 1
-            self.can_undo = False
+            if self.recorder:
+                self.recorder.undo()
+
+    def redo(self):
+        """Makes the last undone move again, if possible."""
+        if self.can_redo:
+            self._restore(self.history.redo(), before=False)
+            self.moves += 1
+            if self.recorder:
+                self.recorder.redo()
+
+    def jump_to(self, move_index):
+        """Undoes or redoes moves until the move count is move_index."""
+        lowest = self.moves - len(self.history)
+        highest = self.moves + self.history.redo_count
+        if not lowest <= move_index <= highest:
+            raise ValueError(f'Move {move_index} is not in the history '
+                             f'(moves {lowest} to {highest})')
+        while self.moves > move_index:
+            self.undo()
+        while self.moves < move_index:
+            self.redo()
     
+    def shift(self, direction):
+        """Shifts the board in the given direction (LEFT, RIGHT, UP, DOWN)."""
+        self._shift(*DIRECTIONS[direction])
+
     def shift_left(self):
         """Shifts the board leftward."""
         self._shift(False, False)
@@ -69,10 +444,53 @@ class GameBoard:
             reverse: If true, rows are shifted right-to-left or columns
                 are shifted upward.
         """
-        # Save current score
+        if self.bitboard:
+            self._shift_bits(vertical, reverse)
+            return
+        # Save current score and biggest cell
         current_score = self.score + 0
+        current_max = self._max
+        # Shift big and compact boards all at once, and small ones row by
+        # row. Either way the shift makes a new board, and only the stored
+        # array is reused.
+        if self.cache is not None:
+            new_board = self._shift_cached(vertical, reverse)
+        elif self.compact or self.size >= VECTOR_SIZE:
+            new_board = self._shift_vectorized(vertical, reverse)
+        else:
+            new_board = self._shift_rows(vertical, reverse)
+        # Check if anything actually moved
+        cells = np.flatnonzero(self._board != new_board)
+        if len(cells) == 0:
+            # Nothing moved, don't count the shift
+            pass
+        else:
+            # Cells actually moved, keep the numbers of the changed cells
+            # and copy their new ones into the stored array
+            before = self._board.flat[cells]
+            self._board.flat[cells] = new_board.flat[cells]
+            self._movable = None
+            # Add a new cell in a random spot
+            cell = self._add_new_cell()
+            # Increase move count
+            self.moves += 1
+            # The new cell was blank before the move, even if it didn't
+            # change otherwise
+            if cell is not None and cell[0] not in cells:
+                cells = np.append(cells, cell[0])
+                before = np.append(before, before.dtype.type(0))
+            # Save the changed cells and score for undo
+            self.history.push(Step(cells, before, self._board.flat[cells],
+                                   current_score, self.score,
+                                   current_max, self._max))
+            # Record the move
+            if self.recorder:
+                self.recorder.move(DIRECTIONS.index((vertical, reverse)), cell)
+
+    def _shift_rows(self, vertical: bool, reverse: bool):
+        """Returns the shifted board, computed row by row."""
         # Make a copy of the board
-        new_board = self.board.copy()
+        new_board = self._board.copy()
         if vertical:
             # Convert the board to a column vector
             new_board = new_board.transpose()
@@ -87,22 +505,87 @@ class GameBoard:
         if vertical:
             # Convert the new board to a row vector again
             new_board = new_board.transpose()
-        # Check if anything actually moved
-        if np.array_equal(self.board, new_board):
-            # Nothing moved, don't count the shift
-            pass
-        else:
-            # Cells actually moved, save current game board and score
-            self.previous_board = self.board.copy()
-            self.previous_score = current_score
-            # Replace board with updated one
-            self.board = new_board.copy()
-            # Add a new cell in a random spot
-            self._add_new_cell()
-            # Increase move count
+        return new_board
+
+    def _shift_vectorized(self, vertical: bool, reverse: bool):
+        """Returns the shifted board, computed with array operations."""
+        board = self._board.transpose() if vertical else self._board
+        if reverse:
+            # Mirror the rows so that the shift is leftward
+            board = board[:, ::-1]
+        new_board, merged, _ = shift_rows(board, exponents=self.compact)
+        if self.compact:
+            merged = to_numbers(merged)
+        if len(merged):
+            # Add the merged numbers to the score, like _reduce does
+            self.score += int(merged.sum())
+            self._empty += len(merged)
+            self._max = max(self._max, int(merged.max()))
+        if reverse:
+            new_board = new_board[:, ::-1]
+        if vertical:
+            new_board = new_board.transpose()
+        return new_board
+
+    def _shift_cached(self, vertical: bool, reverse: bool):
+        """Returns the shifted board, looked up in the position cache."""
+        exponents = self._board if self.compact else to_exponents(self._board)
+        new_board, gained, moved = self.cache.shift_exponents(
+            exponents, DIRECTIONS.index((vertical, reverse)))
+        if not moved:
+            return self._board
+        self.score += gained
+        self._empty = int(np.count_nonzero(new_board == 0))
+        self._max = max(self._max, 1 << int(new_board.max()))
+        return new_board if self.compact else to_numbers(new_board)
+
+    def _shift_bits(self, vertical: bool, reverse: bool):
+        """Shifts the board using the bitboard engine."""
+        new_bits, gained = bb.move(self._bits, vertical, reverse)
+        if new_bits != self._bits:
+            old_bits = self._bits
+            old_score = self.score
+            old_max = self._max
+            self._bits = new_bits
+            self._board_cache = None
+            self._sync_status()
+            self.score += gained
+            cell = self._add_new_cell()
             self.moves += 1
-            # Enable undo action
-            self.can_undo = True
+            self.history.push(Step(None, old_bits, self._bits,
+                                   old_score, self.score,
+                                   old_max, self._max))
+            if self.recorder:
+                self.recorder.move(DIRECTIONS.index((vertical, reverse)), cell)
+
+    def _restore(self, step: Step, before: bool):
+        """Sets the board and score to those before or after a step."""
+        if self.bitboard:
+            self._bits = step.before if before else step.after
+            self._board_cache = None
+            self._sync_status()
+        else:
+            old, new = (step.after, step.before) if before else (step.before,
+                                                                 step.after)
+            self._board.flat[step.cells] = new
+            self._empty += (np.count_nonzero(new == 0)
+                            - np.count_nonzero(old == 0))
+            self._max = step.max_before if before else step.max_after
+            self._movable = None
+        self.score = step.score_before if before else step.score_after
+
+    def _sync_status(self):
+        """Recomputes the blank cell count and biggest cell from scratch."""
+        if self.bitboard:
+            self._empty = bb.count_empty(self._bits)
+            exponent = bb.max_exponent(self._bits)
+            self._max = 1 << exponent if exponent else 0
+        else:
+            self._empty = int(np.count_nonzero(self._board == 0))
+            self._max = int(self._board.max())
+            if self.compact and self._max:
+                self._max = 1 << self._max
+        self._movable = None
     
     def _compress(self, row):
         """Removes blank cells from the given row."""
@@ -129,6 +612,9 @@ class GameBoard:
                     reduced.append(cell_sum)
                     # Add the resulting number to the score
                     self.score += cell_sum
+                    # A cell is freed and the biggest one may have changed
+                    self._empty += 1
+                    self._max = max(self._max, cell_sum)
                     # Skip two spaces to the next cell to reduce
                     i += 2
                 # Otherwise, there is no cell next to the current one,
@@ -156,42 +642,63 @@ class GameBoard:
             return np.array(row)
     
     def _add_new_cell(self):
-        """Adds a 2 or 4 in a random blank cell of the board."""
-        # If the board is full or test mode is active, don't add anything
-        if self.is_full() or self.test_mode:
-            return
-        # Repeat the process until an empty spot is found
-        while True:
-            # Generate a random position
-            row, col = rd.randrange(self.size), rd.randrange(self.size)
-            # If the cell in that position is empty
-            if self.board[row][col] == 0:
-                # Add a random 2 or 4 there
-                self.board[row][col] = rd.choice([2, 4])
-                break
-    
+        """Adds a new cell in a blank spot chosen by the spawner.
+
+        Returns:
+            The (flat index, number) of the new cell, or None if no cell
+            was added.
+        """
+        # If test mode is active, don't add anything
+        if self.test_mode:
+            return None
+        if self.bitboard:
+            empty = bb.empty_cells(self._bits)
+        else:
+            empty = np.flatnonzero(self._board == 0)
+        # If the board is full, there's nowhere to add the cell
+        if len(empty) == 0:
+            return None
+        index, value = self.spawner.spawn(empty)
+        self._empty -= 1
+        self._max = max(self._max, value)
+        self._movable = None
+        if self.bitboard:
+            self._bits = bb.set_cell(self._bits, index, value.bit_length() - 1)
+            self._board_cache = None
+        else:
+            self._board.flat[index] = (value.bit_length() - 1 if self.compact
+                                       else value)
+        return index, value
+
     def _no_moves_left(self):
         """Determines if the board doesn't have any possible move."""
-        row = 0
-        col = 0
-        # Go through each cell
-        for row in range(self.size):
-            for col in range(self.size):
-                # Current cell number
-                current = self.board[row][col]
-                # Check if any of the adjacent cells are
-                # equal to the current one
-                left = (col != 0 and current == self.board[row][col - 1])
-                right = (col != self.size - 1
-                        and current == self.board[row][col + 1])
-                up = (row != 0 and current == self.board[row - 1][col])
-                down = (row != self.size - 1
-                        and current == self.board[row + 1][col])
-                # If so, there are moves to make
-                if left or right or up or down:
-                    return False
-        # No moves were found
-        return True
+        # The answer is kept until the board changes
+        if self._movable is None:
+            if self.bitboard:
+                self._movable = bb.has_moves(self._bits)
+            else:
+                self._movable = self._has_equal_neighbors()
+        return not self._movable
+
+    def _has_equal_neighbors(self):
+        """Determines if any cell is next to an equal one."""
+        board = self._board
+        # Compare each cell with its right neighbor, and only if needed,
+        # with the one below
+        return bool((board[:, 1:] == board[:, :-1]).any()
+                    or (board[1:] == board[:-1]).any())
+
+    def legal_moves(self):
+        """Determines which directions would change the board.
+
+        Returns:
+            Boolean array indexed by direction (LEFT, RIGHT, UP, DOWN).
+        """
+        if self.bitboard:
+            return np.array([bb.move(self._bits, vertical, reverse)[0]
+                             != self._bits
+                             for vertical, reverse in DIRECTIONS])
+        return legal_moves(self._board)
 
 
 # Run tests if executed as script
@@ -237,70 +744,253 @@ if __name__ == '__main__':
                           [4, 256, 128, 2],
                           [128, 32, 16, 2],
                           [4, 4, 16, 2]])
-    board2 = np.fromfunction(lambda x, y: 2**(x+2*y+1), (4, 4), dtype=np.int)
-    board3 = np.fromfunction(lambda x, y: 2**(2*x+y+2), (4, 4), dtype=np.int)
-    # Create game boards
-    boards = []
-    for i in range(6):
-        if i < 4:
+    board2 = np.fromfunction(lambda x, y: 2**(x+2*y+1), (4, 4), dtype=np.int64)
+    board3 = np.fromfunction(lambda x, y: 2**(2*x+y+2), (4, 4), dtype=np.int64)
+    # Run the same checks with every engine
+    engines = ({}, {'bitboard': True}, {'compact': True})
+    for options in engines:
+        # Create game boards
+        boards = []
+        for i in range(6):
+            if i < 4:
+                gb = GameBoard(test=True, **options)
+                gb.board = board0.copy()
+                boards.append(gb)
+            else:
+                gb = GameBoard(**options)
+                gb.board = board1.copy()
+                gb.moves = 60
+                gb.score = 3556
+                boards.append(gb)
+        boards.append(GameBoard(**options))
+        boards[6].board = board2.copy()
+        boards.append(GameBoard(**options))
+        boards[7].board = board3.copy()
+        # Make shifts
+        boards[0].shift_left()
+        boards[1].shift_right()
+        boards[2].shift_up()
+        boards[3].shift_down()
+        boards[4].shift_left()
+        boards[5].shift_right()
+        # Compare resulting boards
+        assert np.array_equal(boards[0].board, board0_l)
+        assert np.array_equal(boards[1].board, board0_r)
+        assert np.array_equal(boards[2].board, board0_u)
+        assert np.array_equal(boards[3].board, board0_d)
+        assert (np.array_equal(boards[4].board, board1_l0)
+                or np.array_equal(boards[4].board, board1_l1))
+        assert (np.array_equal(boards[5].board, board1_r0)
+                or np.array_equal(boards[5].board, board1_r1))
+        # Compare resulting scores
+        expected_scores = [8, 8, 4, 4, 3560, 3560]
+        for i in range(6):
+            assert boards[i].score == expected_scores[i]
+        # Compare resulting move counts
+        expected_move_counts = [1, 1, 1, 1, 61, 61]
+        for i in range(6):
+            assert boards[i].moves == expected_move_counts[i]
+        # Check if previous states match original
+        for i in range(6):
+            if i < 4:
+                assert np.array_equal(boards[i].previous_board, board0)
+            else:
+                assert np.array_equal(boards[i].previous_board, board1)
+        # Check if previous scores match original
+        for i in range(6):
+            if i < 4:
+                assert boards[i].previous_score == 0
+            else:
+                assert boards[i].previous_score == 3556
+        # Test win/loss detection
+        for i in range(8):
+            if i != 6:
+                assert not boards[i].lost()
+            else:
+                assert boards[i].lost()
+            if i != 7:
+                assert not boards[i].won()
+            else:
+                assert boards[i].won()
+    # Compare bitboard shifts against the NumPy engine on random boards
+    rng = np.random.default_rng(2048)
+    for _ in range(200):
+        cells = rng.integers(0, 6, (4, 4))
+        layout = np.where(cells > 0, 2**cells, 0)
+        for vertical, reverse in ((False, False), (False, True),
+                                  (True, False), (True, True)):
             gb = GameBoard(test=True)
-            gb.board = board0.copy()
-            boards.append(gb)
-        else:
-            gb = GameBoard()
-            gb.board = board1.copy()
-            gb.moves = 60
-            gb.score = 3556
-            boards.append(gb)
-    boards.append(GameBoard())
-    boards[6].board = board2.copy()
-    boards.append(GameBoard())
-    boards[7].board = board3.copy()
-    # Make shifts
-    boards[0].shift_left()
-    boards[1].shift_right()
-    boards[2].shift_up()
-    boards[3].shift_down()
-    boards[4].shift_left()
-    boards[5].shift_right()
-    # Compare resulting boards
-    assert np.array_equal(boards[0].board, board0_l)
-    assert np.array_equal(boards[1].board, board0_r)
-    assert np.array_equal(boards[2].board, board0_u)
-    assert np.array_equal(boards[3].board, board0_d)
-    assert (np.array_equal(boards[4].board, board1_l0)
-            or np.array_equal(boards[4].board, board1_l1))
-    assert (np.array_equal(boards[5].board, board1_r0)
-            or np.array_equal(boards[5].board, board1_r1))
-    # Compare resulting scores
-    expected_scores = [8, 8, 4, 4, 3560, 3560]
-    for i in range(6):
-        assert boards[i].score == expected_scores[i]
-    # Compare resulting move counts
-    expected_move_counts = [1, 1, 1, 1, 61, 61]
-    for i in range(6):
-        assert boards[i].moves == expected_move_counts[i]
-    # Check if previous states match original
-    for i in range(6):
-        if i < 4:
-            assert np.array_equal(boards[i].previous_board, board0)
-        else:
-            assert np.array_equal(boards[i].previous_board, board1)
-    # Check if previous scores match original
-    for i in range(6):
-        if i < 4:
-            assert boards[i].previous_score == 0
-        else:
-            assert boards[i].previous_score == 3556
-    # Test win/loss detection
-    for i in range(8):
-        if i != 6:
-            assert not boards[i].lost()
-        else:
-            assert boards[i].lost()
-        if i != 7:
-            assert not boards[i].won()
-        else:
-            assert boards[i].won()
+            gb.board = layout.copy()
+            gb._shift(vertical, reverse)
+            bits, gained = bb.move(bb.pack(layout), vertical, reverse)
+            assert np.array_equal(bb.unpack(bits), gb.board)
+            assert gained == gb.score
+    # Seeded games can be reproduced and replayed
+    recorder = spawn.RecordingSpawner(spawn.SeededSpawner(7))
+    games = [GameBoard(spawner=recorder), GameBoard(seed=7)]
+    directions = rng.integers(0, 4, 100)
+    for direction in directions:
+        games[0].shift(direction)
+        games[1].shift(direction)
+    assert np.array_equal(games[0].board, games[1].board)
+    game = GameBoard(spawner=spawn.ReplaySpawner(recorder.spawns))
+    for direction in directions:
+        game.shift(direction)
+    assert np.array_equal(games[0].board, game.board)
+    # Multi-level undo and redo
+    for options in engines:
+        game = GameBoard(seed=5, history_size=50, **options)
+        positions = [(game.board.copy(), game.score)]
+        for direction in rng.integers(0, 4, 200):
+            moves = game.moves
+            game.shift(direction)
+            if game.moves > moves:
+                positions.append((game.board.copy(), game.score))
+        assert len(game.history) == 50
+        game.jump_to(game.moves - 50)
+        assert not game.can_undo and game.can_redo
+        assert np.array_equal(game.board, positions[game.moves][0])
+        assert game.score == positions[game.moves][1]
+        game.redo()
+        game.redo()
+        assert np.array_equal(game.board, positions[game.moves][0])
+        game.undo()
+        assert np.array_equal(game.board, positions[game.moves][0])
+        game.jump_to(len(positions) - 1)
+        assert np.array_equal(game.board, positions[-1][0])
+        assert game.score == positions[-1][1]
+        assert not game.can_redo
+    # Status is tracked through moves, undos and redos
+    for options in engines:
+        game = GameBoard(size=4, seed=9, **options)
+        for direction in rng.integers(0, 4, 300):
+            if game.lost():
+                game.jump_to(game.moves - 3)
+            game.shift(direction)
+            assert game._empty == np.count_nonzero(game.board == 0)
+            assert game._max == game.board.max()
+            assert game.is_full() == (game.board.min() > 0)
+    # The vectorized kernel matches the row by row shifts
+    for size in (8, 16, 64):
+        layouts = [np.zeros((size, size), dtype=int),
+                   np.full((size, size), 2)]
+        for _ in range(20):
+            cells = rng.integers(0, 4, (size, size))
+            layouts.append(np.where(cells > 0, 2**cells, 0))
+        for layout in layouts:
+            for vertical, reverse in DIRECTIONS:
+                games = [GameBoard(size, test=True) for i in range(2)]
+                for game in games:
+                    game.board = layout.copy()
+                games[0]._board = games[0]._shift_rows(vertical, reverse)
+                games[1]._board = games[1]._shift_vectorized(vertical,
+                                                             reverse)
+                assert np.array_equal(games[0].board, games[1].board)
+                assert games[0].score == games[1].score
+                assert games[0]._empty == games[1]._empty
+                assert games[0]._max == games[1]._max
+    # Legal moves match the shifts that change the board
+    for size, bitboard in ((4, False), (4, True), (5, False), (16, False)):
+        for _ in range(50):
+            cells = rng.integers(0, 3, (size, size))
+            layout = np.where(cells > 0, 2**cells, 0)
+            game = GameBoard(size, test=True, bitboard=bitboard)
+            game.board = layout
+            legal = game.legal_moves()
+            for direction in range(4):
+                game.board = layout.copy()
+                moves = game.moves
+                game.shift(direction)
+                assert legal[direction] == (game.moves > moves)
+            if game.is_full():
+                game.board = layout
+                assert game._no_moves_left() == (not legal.any())
+    layouts = rng.integers(0, 3, (10, 6, 6))
+    assert np.array_equal(legal_moves(layouts),
+                          [legal_moves(layout) for layout in layouts])
+    # Compact boards play like regular ones, in a byte per cell
+    games = [GameBoard(16, seed=4, compact=compact) for compact in (False,
+                                                                    True)]
+    for direction in rng.integers(0, 4, 300):
+        for game in games:
+            game.shift(direction)
+        assert np.array_equal(games[0].board, games[1].board)
+        assert games[0].score == games[1].score
+        assert games[0]._max == games[1]._max
+    assert games[1]._board.dtype == np.uint8
+    assert games[1]._board.nbytes * 8 == games[0]._board.nbytes
+    # Reading the board doesn't keep a converted copy
+    assert games[1]._board_cache is None
+    assert np.array_equal(games[0].previous_board, games[1].previous_board)
+    # Boards can't be edited in place, which would skip the status updates
+    for options in ({}, {'compact': True}, {'bitboard': True}):
+        game = GameBoard(seed=1, **options)
+        try:
+            game.board[0][0] = 2048
+            assert False
+        except ValueError:
+            pass
+        board = game.board.copy()
+        board[0][0] = 2048
+        game.board = board
+        assert game.won()
+    # Numbers too big for a bitboard cell are refused
+    game = GameBoard(bitboard=True, seed=1)
+    board = game.board
+    try:
+        game.board = [[65536, 0, 0, 0]] + [[0] * 4] * 3
+        assert False
+    except ValueError:
+        pass
+    assert np.array_equal(game.board, board)
+    game.board = [[32768, 0, 0, 0]] + [[0] * 4] * 3
+    assert game.board[0, 0] == 32768
+    # Snapshots restore the whole game, which then plays the same way
+    import os
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'game.snapshot')
+    for size, options in ((4, {}), (4, {'bitboard': True}),
+                          (6, {'compact': True})):
+        game = GameBoard(size, seed=11, history_size=30, **options)
+        for direction in rng.integers(0, 4, 100):
+            game.shift(direction)
+        game.undo()
+        game.undo()
+        game.save(path)
+        loaded = GameBoard.load(path)
+        assert os.path.getsize(path) <= (100 + size * size + 30
+                                         * (STEP_HEADER.size + 6 * size**2))
+        for restored in (loaded, GameBoard.from_bytes(game.to_bytes())):
+            assert np.array_equal(restored.board, game.board)
+            assert restored.score == game.score
+            assert restored.moves == game.moves
+            assert restored.history.capacity == 30
+            assert len(restored.history) == len(game.history)
+            assert restored.history.redo_count == 2
+        for direction in rng.integers(0, 4, 50):
+            game.shift(direction)
+            loaded.shift(direction)
+        game.jump_to(game.moves - 20)
+        loaded.jump_to(loaded.moves - 20)
+        assert np.array_equal(loaded.board, game.board)
+        assert loaded.score == game.score
+        assert loaded._max == game._max and loaded._empty == game._empty
+    # Games without undo and with unlimited undo keep their capacity
+    for capacity in (0, None):
+        game = GameBoard(seed=12, history_size=capacity)
+        restored = GameBoard.from_bytes(game.to_bytes())
+        assert restored.history.capacity == capacity
+        for direction in rng.integers(0, 4, 20):
+            restored.shift(direction)
+        assert len(restored.history) == (0 if capacity == 0
+                                         else restored.moves)
+    try:
+        GameBoard(spawner=spawn.RandomSpawner()).to_bytes()
+        assert False
+    except ValueError:
+        pass
+    # Configurable spawn distribution
+    game = GameBoard(size=8, spawner=spawn.SeededSpawner(3, ((4, 1.0),)))
+    assert game.board.sum() == 4
     # Finish
     print('All tests passed.')
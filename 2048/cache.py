@@ -0,0 +1,280 @@
+import os
+from collections import OrderedDict
+import numpy as np
+from .board import DIRECTIONS, shift_rows, to_exponents, to_numbers
+
+# The 8 symmetries of the square, as (transpose, flip rows, flip columns)
+# applied in that order
+SYMMETRIES = tuple((transpose, flip_rows, flip_columns)
+                   for transpose in (False, True)
+                   for flip_rows in (False, True)
+                   for flip_columns in (False, True))
+# Estimated bytes taken by an entry besides its keys and boards
+ENTRY_OVERHEAD = 200
+# Version of the files written by PositionCache.save. They are NumPy .npz
+# files with the key lengths, the keys and result boards one after the
+# other (each result is one byte shorter than its key, which ends with the
+# direction) and the score gains, oldest entry first.
+FILE_VERSION = 2
+
+
+def transform(board, symmetry):
+    """Applies a symmetry of the square to a board.
+
+    Stacks of boards are transformed at once, since only the last two
+    axes are used.
+    """
+    transpose, flip_rows, flip_columns = symmetry
+    if transpose:
+        board = board.swapaxes(-2, -1)
+    if flip_rows:
+        board = board[..., ::-1, :]
+    if flip_columns:
+        board = board[..., ::-1]
+    return board
+
+
+def untransform(board, symmetry):
+    """Reverts a symmetry of the square applied to a board."""
+    transpose, flip_rows, flip_columns = symmetry
+    if flip_columns:
+        board = board[..., ::-1]
+    if flip_rows:
+        board = board[..., ::-1, :]
+    if transpose:
+        board = board.swapaxes(-2, -1)
+    return board
+
+
+def transform_direction(direction, symmetry):
+    """Returns the direction that a symmetry turns the given one into."""
+    transpose, flip_rows, flip_columns = symmetry
+    vertical, reverse = DIRECTIONS[direction]
+    vertical ^= transpose
+    reverse ^= flip_rows if vertical else flip_columns
+    return DIRECTIONS.index((vertical, reverse))
+
+
+def canonicalize(exponents):
+    """Finds the representative of a board among its symmetric copies.
+
+    Args:
+        exponents: Square array of the base 2 logarithms of the cells.
+
+    Returns:
+        A tuple with the key of the representative, which packs its cells
+        one per byte, and the symmetry that turns the board into it.
+    """
+    exponents = np.asarray(exponents, dtype=np.uint8)
+    best = None
+    for symmetry in SYMMETRIES:
+        key = np.ascontiguousarray(transform(exponents, symmetry)).tobytes()
+        if best is None or key < best[0]:
+            best = key, symmetry
+    return best
+
+
+class PositionCache:
+    """Shared cache of shift results, with least-recently-used eviction.
+
+    Boards are stored once for all their rotations and reflections, and
+    the cache can be saved to disk to warm up later runs. It can be given
+    to any number of GameBoards, which then look up their shifts in it.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        """Fraction of the lookups that were found in the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def shift(self, board, direction):
+        """Shifts an array of cell numbers.
+
+        Returns:
+            A tuple with the new board, the score gained and whether
+            anything moved.
+        """
+        new_board, gained, moved = self.shift_exponents(to_exponents(board),
+                                                        direction)
+        return to_numbers(new_board), gained, moved
+
+    def shift_exponents(self, exponents, direction):
+        """Shifts an array of base 2 logarithms of cells.
+
+        Returns:
+            A tuple with the new array of logarithms, the score gained and
+            whether anything moved.
+        """
+        size = len(exponents)
+        key, symmetry = canonicalize(exponents)
+        key += bytes([transform_direction(direction, symmetry)])
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = self._compute(key, size)
+            self._put(key, entry)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        result, gained = entry
+        new_board = np.frombuffer(result, dtype=np.uint8).reshape(size, size)
+        moved = result != key[:-1]
+        return np.array(untransform(new_board, symmetry)), gained, moved
+
+    def save(self, path):
+        """Writes the cached positions to a file."""
+        keys = list(self._entries)
+        entries = list(self._entries.values())
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as file:
+            np.savez(file, version=np.array(FILE_VERSION),
+                     lengths=np.array([len(key) for key in keys],
+                                      dtype=np.uint32),
+                     keys=np.frombuffer(b''.join(keys), dtype=np.uint8),
+                     results=np.frombuffer(b''.join(result for result, _
+                                                    in entries),
+                                           dtype=np.uint8),
+                     gains=np.array([gained for _, gained in entries],
+                                    dtype=np.uint64))
+        os.replace(temporary, path)
+
+    def load(self, path):
+        """Adds the positions saved in a file, if it exists.
+
+        Returns:
+            The number of positions loaded.
+
+        Raises:
+            ValueError: The file isn't a supported cache file.
+        """
+        if not os.path.exists(path):
+            return 0
+        with np.load(path) as data:
+            version = int(data['version'])
+            if version != FILE_VERSION:
+                raise ValueError(f'Unsupported cache file version {version}')
+            lengths = data['lengths'].astype(np.int64)
+            keys = data['keys'].tobytes()
+            results = data['results'].tobytes()
+            gains = data['gains']
+        key_ends = np.cumsum(lengths)
+        result_ends = np.cumsum(lengths - 1)
+        if (len(gains) != len(lengths) or key_ends[-1:].sum() != len(keys)
+                or result_ends[-1:].sum() != len(results)):
+            raise ValueError(f'{path} is not a valid cache file')
+        for key_end, result_end, length, gained in zip(
+                key_ends, result_ends, lengths, gains):
+            self._put(keys[key_end - length:key_end],
+                      (results[result_end - length + 1:result_end],
+                       int(gained)))
+        return len(lengths)
+
+    def clear(self):
+        """Removes every cached position and resets the counters."""
+        self._entries.clear()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _compute(self, key, size):
+        """Shifts the canonical board of a key in the key's direction."""
+        board = np.frombuffer(key, dtype=np.uint8, count=size * size)
+        board = board.reshape(size, size)
+        vertical, reverse = DIRECTIONS[key[-1]]
+        if vertical:
+            board = board.transpose()
+        if reverse:
+            board = board[:, ::-1]
+        new_board, merged, _ = shift_rows(board, exponents=True)
+        if reverse:
+            new_board = new_board[:, ::-1]
+        if vertical:
+            new_board = new_board.transpose()
+        gained = int(to_numbers(merged).sum())
+        return np.ascontiguousarray(new_board).tobytes(), gained
+
+    def _put(self, key, entry):
+        """Stores an entry, evicting the least recently used if needed."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = entry
+        self.bytes += self._entry_bytes(key)
+        while self.bytes > self.max_bytes and self._entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self.bytes -= self._entry_bytes(old_key)
+            self.evictions += 1
+
+    @staticmethod
+    def _entry_bytes(key):
+        """Estimates the memory taken by the entry of a key."""
+        return ENTRY_OVERHEAD + 2 * len(key)
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import tempfile
+    from .board import GameBoard
+    rng = np.random.default_rng(15)
+    # Symmetric boards share entries and give the same shifts
+    cache = PositionCache()
+    for _ in range(100):
+        cells = rng.integers(0, 5, (4, 4))
+        layout = np.where(cells > 0, 2**cells, 0)
+        for direction in range(4):
+            game = GameBoard(test=True)
+            game.board = layout
+            game.shift(direction)
+            for symmetry in SYMMETRIES:
+                board = transform(layout, symmetry)
+                new_board, gained, moved = cache.shift(
+                    board, transform_direction(direction, symmetry))
+                assert np.array_equal(untransform(new_board, symmetry),
+                                      game.board)
+                assert gained == game.score
+                assert moved == (game.moves == 1)
+    assert len(cache) <= 400
+    assert cache.hits >= 7 * 400 and cache.misses == len(cache)
+    # Games with a cache play like games without one
+    cache = PositionCache()
+    games = [GameBoard(6, seed=3), GameBoard(6, seed=3, cache=cache),
+             GameBoard(6, seed=3, cache=cache, compact=True)]
+    for direction in rng.integers(0, 4, 300):
+        for game in games:
+            game.shift(direction)
+    for game in games[1:]:
+        assert np.array_equal(game.board, games[0].board)
+        assert game.score == games[0].score
+        assert game._empty == games[0]._empty
+        assert game._max == games[0]._max
+    # The memory cap is respected
+    small = PositionCache(max_bytes=50 * (ENTRY_OVERHEAD + 34))
+    for _ in range(200):
+        cells = rng.integers(0, 4, (4, 4))
+        small.shift(np.where(cells > 0, 2**cells, 0), 0)
+    assert len(small) == 50 and small.bytes <= small.max_bytes
+    assert small.evictions == small.misses - 50
+    # Saved caches warm up new ones
+    path = os.path.join(tempfile.mkdtemp(), 'positions.cache')
+    board = games[0].board
+    cache.shift(board, 0)
+    cache.shift(layout, 1)
+    cache.save(path)
+    warm = PositionCache()
+    assert warm.load(path) == len(cache)
+    assert list(warm._entries.items()) == list(cache._entries.items())
+    warm.shift(board, 0)
+    assert warm.hits == 1 and warm.misses == 0
+    assert PositionCache().load(path + '.missing') == 0
+    print('All tests passed.')
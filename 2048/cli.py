@@ -1,14 +1,18 @@
+import json
 import sys
 from .board import GameBoard
 
 
-def main(size, win):
+def main(size, win, profiler=None):
     game = GameBoard(size, win)
+    if profiler:
+        profiler.attach(game)
     actions = {'l': game.shift_left,
                'r': game.shift_right,
                'u': game.shift_up,
                'd': game.shift_down,
                'undo': game.undo,
+               'redo': game.redo,
                'exit': None}
     stop = False
     while not stop:
@@ -28,12 +32,89 @@ def main(size, win):
             print()
 
 
-def print_gameboard(gb: GameBoard):
-    print(f'..:: {gb.win} GAME ::..')
-    print(f'Score: {gb.get_score()}')
-    print(f'Moves: {gb.moves}')
-    print()
-    print('+'.join(['-'*6 for i in range(gb.size)]))
+def run_script(source, output=sys.stdout, size=4, win=2048, seed=None,
+               json_lines=False, trace=False, history_size=1000,
+               profiler=None):
+    """Plays a stream of actions without prompting.
+
+    Args:
+        source: Text stream of actions separated by whitespace: l, r, u,
+            d, undo, redo, print (to show the board) or exit.
+        output: Text stream the boards are written to.
+        size: Size of the board.
+        win: Cell number needed to win.
+        seed: Seed of the game, random if None.
+        json_lines: If true, boards are written as JSON lines with the
+            score and move count, instead of being drawn.
+        trace: If true, the board is shown after every action, instead of
+            only on request and at the end.
+        history_size: Number of moves that can be undone, which bounds the
+            memory used by long scripts.
+        profiler: Optional Profiler to instrument the game with.
+
+    Returns:
+        The GameBoard after playing the actions.
+
+    Raises:
+        ValueError: An action is invalid.
+    """
+    game = GameBoard(size, win, bitboard=True, seed=seed,
+                     history_size=history_size)
+    if profiler:
+        profiler.attach(game)
+    actions = {'l': game.shift_left,
+               'r': game.shift_right,
+               'u': game.shift_up,
+               'd': game.shift_down,
+               'undo': game.undo,
+               'redo': game.redo}
+
+    def show():
+        if json_lines:
+            output.write(json.dumps(game_state(game)) + '\n')
+        else:
+            print_gameboard(game, output)
+
+    count = 0
+    for line in source:
+        for token in line.split():
+            count += 1
+            action = actions.get(token)
+            if action is not None:
+                action()
+                if trace:
+                    show()
+            elif token == 'print':
+                show()
+            elif token == 'exit':
+                if not trace:
+                    show()
+                return game
+            else:
+                raise ValueError(f'Invalid action {token!r} '
+                                 f'(action {count})')
+    if not trace:
+        show()
+    return game
+
+
+def game_state(game: GameBoard):
+    """Describes a game as a JSON-serializable dict."""
+    return {'board': game.board.tolist(),
+            'score': game.score,
+            'moves': game.moves,
+            'won': bool(game.won()),
+            'lost': bool(game.lost()),
+            'can_undo': game.can_undo,
+            'can_redo': game.can_redo}
+
+
+def print_gameboard(gb: GameBoard, file=None):
+    print(f'..:: {gb.win} GAME ::..', file=file)
+    print(f'Score: {gb.get_score()}', file=file)
+    print(f'Moves: {gb.moves}', file=file)
+    print(file=file)
+    print('+'.join(['-'*6 for i in range(gb.size)]), file=file)
     for row in gb.board:
         items = []
         for cell in row:
@@ -41,16 +122,75 @@ def print_gameboard(gb: GameBoard):
                 items.append(' '*6)
             else:
                 items.append(f' {cell :<4} ')
-        print('|'.join(items))
-        print('+'.join(['-'*6 for i in range(gb.size)]))
-    print()
+        print('|'.join(items), file=file)
+        print('+'.join(['-'*6 for i in range(gb.size)]), file=file)
+    print(file=file)
 
 
 def input_action(actions):
     while True:
-        user_input = input('Shift board (l/r/u/d) or do action (undo/exit): ')
+        user_input = input('Shift board (l/r/u/d) or do action '
+                           '(undo/redo/exit): ')
         user_input = user_input.strip().lower()
         if user_input in actions.keys():
             return actions[user_input]
         else:
             print('ERROR: Invalid action. Try again.')
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import io
+    import numpy as np
+    # Scripts play like the same moves made one by one
+    script = 'l r u d\nundo undo redo\n' + 'l u r d ' * 50
+    output = io.StringIO()
+    game = run_script(io.StringIO(script), output, seed=3, json_lines=True)
+    reference = GameBoard(seed=3)
+    for token in script.split():
+        {'l': reference.shift_left, 'r': reference.shift_right,
+         'u': reference.shift_up, 'd': reference.shift_down,
+         'undo': reference.undo, 'redo': reference.redo}[token]()
+    state = json.loads(output.getvalue())
+    assert np.array_equal(state['board'], reference.board)
+    assert state['score'] == reference.score == game.score
+    assert state['moves'] == reference.moves
+    # Boards are shown on request, after every action or at the end
+    output = io.StringIO()
+    run_script(io.StringIO('l print r exit u'), output, seed=3,
+               json_lines=True)
+    assert [json.loads(line)['moves'] for line in
+            output.getvalue().splitlines()] == [1, 2]
+    output = io.StringIO()
+    run_script(io.StringIO('l r u'), output, seed=3, json_lines=True,
+               trace=True)
+    assert len(output.getvalue().splitlines()) == 3
+    output = io.StringIO()
+    run_script(io.StringIO(''), output, seed=3)
+    assert output.getvalue().startswith('..:: 2048 GAME ::..')
+    try:
+        run_script(io.StringIO('l x'), output)
+        assert False
+    except ValueError as error:
+        assert 'action 2' in str(error)
+    # The CLI starts quickly, without loading pygame
+    import os
+    import subprocess
+    import time
+    target = 0.6
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for argv, actions in ((['--script', '-'], 'l r u d'),
+                          (['--cli'], 'l\nexit\n')):
+        code = ('import runpy, sys; '
+                f'sys.argv = ["2048"] + {argv!r}; '
+                'runpy.run_module("2048", run_name="__main__"); '
+                'assert "pygame" not in sys.modules, "pygame was imported"')
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=package,
+                                input=actions, capture_output=True,
+                                text=True)
+        elapsed = time.perf_counter() - start
+        assert result.returncode == 0, result.stderr
+        assert 'pygame' not in result.stdout
+        assert elapsed < target, f'Startup took {elapsed:.2f} s'
+    print('All tests passed.')
@@ -0,0 +1,222 @@
+import argparse
+import glob
+import multiprocessing as mp
+import os
+import random as rd
+import time
+import numpy as np
+from . import selfplay
+from .board import GameBoard, to_exponents
+from .cache import SYMMETRIES, transform, transform_direction
+
+# Arrays of a chunk of transitions. Boards are stored as the base 2
+# logarithms of their cells.
+FIELDS = ('states', 'actions', 'rewards', 'next_states', 'dones')
+
+
+def transitions(strategy, seed, size=4, win=None):
+    """Plays a seeded game and yields its transitions.
+
+    Args:
+        strategy: Function that takes the game and a random generator and
+            returns the directions to try, in order of preference, like
+            the strategies of selfplay.
+        seed: Seed of both the board and the strategy.
+        size: Size of the board.
+        win: Cell number that ends the game. If None, plays until lost.
+
+    Yields:
+        (state, action, reward, next_state, done) tuples, where the states
+        are arrays of cell logarithms, the action is the direction played,
+        the reward is the score gained and done tells if the game ended.
+    """
+    rng = rd.Random(seed)
+    game = GameBoard(size, win or 1 << 62, bitboard=True, compact=True,
+                     seed=seed, history_size=0)
+    state = to_exponents(game.board)
+    while not game.won() and not game.lost():
+        score = game.score
+        direction = selfplay.play_move(strategy, game, rng)
+        if direction is None:
+            # None of the directions moved anything
+            break
+        next_state = to_exponents(game.board)
+        yield (state, direction, game.score - score, next_state,
+               game.won() or game.lost())
+        state = next_state
+
+
+def chunked(items, size, chunk_size):
+    """Groups transitions into dicts of arrays of at most chunk_size each."""
+    chunk = None
+    count = 0
+    for item in items:
+        if chunk is None:
+            chunk = _empty_chunk(size, chunk_size)
+            count = 0
+        for field, value in zip(FIELDS, item):
+            chunk[field][count] = value
+        count += 1
+        if count == chunk_size:
+            yield chunk
+            chunk = None
+    if chunk is not None:
+        yield {field: array[:count] for field, array in chunk.items()}
+
+
+def augment(chunk):
+    """Adds the 7 rotated and reflected copies of every transition.
+
+    Returns:
+        A chunk 8 times as long, with the transitions of each symmetry
+        together, starting with the original ones.
+    """
+    parts = {field: [] for field in FIELDS}
+    for symmetry in SYMMETRIES:
+        directions = np.array([transform_direction(direction, symmetry)
+                               for direction in range(4)], dtype=np.uint8)
+        parts['states'].append(transform(chunk['states'], symmetry))
+        parts['actions'].append(directions[chunk['actions']])
+        parts['rewards'].append(chunk['rewards'])
+        parts['next_states'].append(transform(chunk['next_states'], symmetry))
+        parts['dones'].append(chunk['dones'])
+    return {field: np.concatenate(arrays) for field, arrays in parts.items()}
+
+
+def generate(directory, games, workers=1, strategy='random', seed=0,
+             size=4, win=None, depth=2, chunk_size=65536, symmetries=False):
+    """Plays games across a pool of processes and saves their transitions.
+
+    Every task plays a contiguous range of games, game i being seeded with
+    seed + i, and writes its transitions to numbered .npz files of at most
+    chunk_size transitions (8 times that with symmetries), so memory use
+    doesn't depend on the number of games.
+
+    Returns:
+        A tuple with the number of transitions written and the wall time
+        in seconds.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    tasks_count = max(1, min(games, 4 * workers))
+    bounds = np.linspace(0, games, tasks_count + 1).astype(int)
+    tasks = [(directory, task, seed + first, last - first, size, win,
+              chunk_size, symmetries)
+             for task, (first, last) in enumerate(zip(bounds, bounds[1:]))]
+    if workers <= 1:
+        selfplay._init_worker(strategy, depth)
+        counts = [_generate_task(task) for task in tasks]
+    else:
+        with mp.Pool(workers, selfplay._init_worker,
+                     (strategy, depth)) as pool:
+            counts = pool.map(_generate_task, tasks, 1)
+    return sum(counts), time.perf_counter() - start
+
+
+def read_chunks(directory):
+    """Yields the chunks of transitions saved by generate, in order."""
+    for path in sorted(glob.glob(os.path.join(directory, 'part-*.npz'))):
+        with np.load(path) as data:
+            yield {field: data[field] for field in FIELDS}
+
+
+def _empty_chunk(size, length):
+    """Allocates the arrays of a chunk of transitions."""
+    return {'states': np.zeros((length, size, size), dtype=np.uint8),
+            'actions': np.zeros(length, dtype=np.uint8),
+            'rewards': np.zeros(length, dtype=np.int64),
+            'next_states': np.zeros((length, size, size), dtype=np.uint8),
+            'dones': np.zeros(length, dtype=bool)}
+
+
+def _generate_task(task):
+    """Plays a range of games and writes their transitions.
+
+    Returns:
+        The number of transitions written.
+    """
+    directory, number, first_seed, games, size, win, chunk_size, \
+        symmetries = task
+    items = (transition for seed in range(first_seed, first_seed + games)
+             for transition in transitions(selfplay._strategy, seed, size,
+                                           win))
+    count = 0
+    for i, chunk in enumerate(chunked(items, size, chunk_size)):
+        if symmetries:
+            chunk = augment(chunk)
+        np.savez(os.path.join(directory, f'part-{number:05d}-{i:05d}.npz'),
+                 **chunk)
+        count += len(chunk['actions'])
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m 2048 dataset',
+        description='Save the transitions of self-played games.')
+    parser.add_argument('directory', help='directory for the .npz files')
+    parser.add_argument('--games', type=int, default=1000,
+                        help='number of games to play')
+    parser.add_argument('--workers', type=int, default=mp.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--strategy', choices=selfplay.STRATEGIES.keys(),
+                        default='random', help='strategy to play with')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='search depth of the expectimax strategy')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game')
+    parser.add_argument('--size', type=int, default=4,
+                        help='size of the board')
+    parser.add_argument('--win', type=int, default=None,
+                        help='cell number that ends a game (default: '
+                             'play until lost)')
+    parser.add_argument('--chunk-size', type=int, default=65536,
+                        help='transitions per file (before symmetries)')
+    parser.add_argument('--symmetries', action='store_true',
+                        help='add the 7 rotated and reflected copies of '
+                             'every transition')
+    args = parser.parse_args(argv)
+    if args.strategy == 'expectimax' and args.size != 4:
+        parser.error('the expectimax strategy only plays 4x4 boards')
+    count, elapsed = generate(args.directory, args.games, args.workers,
+                              args.strategy, args.seed, args.size, args.win,
+                              args.depth, args.chunk_size, args.symmetries)
+    print(f'{count} transitions ({count / elapsed:.0f}/s)')
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import tempfile
+    from .board import to_numbers
+    # Transitions follow the game
+    steps = list(transitions(selfplay.random_strategy, 5))
+    assert steps[-1][4] and not any(step[4] for step in steps[:-1])
+    for state, action, reward, next_state, done in steps[:50]:
+        game = GameBoard(test=True)
+        game.board = to_numbers(state)
+        game.shift(action)
+        assert game.score == reward
+        # The next state is the shifted board plus the new cell
+        assert np.count_nonzero(to_exponents(game.board) != next_state) == 1
+    # Augmented transitions are valid too
+    chunk = next(chunked(iter(steps), 4, 20))
+    augmented = augment(chunk)
+    assert len(augmented['actions']) == 160
+    for i in range(0, 160, 7):
+        game = GameBoard(test=True)
+        game.board = to_numbers(augmented['states'][i])
+        game.shift(augmented['actions'][i])
+        assert game.score == augmented['rewards'][i]
+    # Generated files hold every transition, whatever the worker count
+    totals = []
+    for workers in (1, 2):
+        directory = tempfile.mkdtemp()
+        count, _ = generate(directory, 6, workers, seed=3, chunk_size=100,
+                            symmetries=workers == 2)
+        chunks = list(read_chunks(directory))
+        assert all(len(chunk['actions']) <= 800 for chunk in chunks)
+        assert sum(len(chunk['actions']) for chunk in chunks) == count
+        assert chunks[0]['states'].dtype == np.uint8
+        totals.append(count)
+    assert totals[1] == 8 * totals[0]
+    print('All tests passed.')
@@ -0,0 +1,280 @@
+import argparse
+import multiprocessing as mp
+from collections import namedtuple
+from . import bitboard as bb
+from . import spawn
+from .board import GameBoard, DIRECTIONS
+
+# Result of an analysis. Probabilities are bounds of the chance of
+# reaching the win number with optimal play, which are equal when the
+# search was deep enough to be exact. moves holds the bounds of every
+# direction (None if illegal), and positions the number of memoized ones.
+Analysis = namedtuple('Analysis', ['best_move', 'lower', 'upper', 'moves',
+                                   'nodes', 'positions'])
+
+
+def canonical(state):
+    """Returns the smallest packed board among the 8 symmetric copies."""
+    best = state
+    for board in (state, bb.transpose(state)):
+        mirrored = bb.mirror(board)
+        best = min(best, board, mirrored, bb.flip(board), bb.flip(mirrored))
+    return best
+
+
+class EndgameSolver:
+    """Exhaustive search of the positions reachable from a packed board.
+
+    Player moves are maximized and every spawn outcome is weighted by its
+    probability. Positions are memoized by their canonical packed board,
+    so rotations and reflections are searched once. Searches cut off by
+    the depth limit give bounds instead of exact probabilities.
+    """
+
+    def __init__(self, win=2048, distribution=spawn.DISTRIBUTION,
+                 max_positions=2**21):
+        self.win_exponent = win.bit_length() - 1
+        self.distribution = [(number.bit_length() - 1, probability)
+                             for number, probability in distribution]
+        self.max_positions = max_positions
+        # Canonical board -> (depth searched, lower bound, upper bound)
+        self.memo = {}
+        self.nodes = 0
+
+    def value(self, state, depth):
+        """Bounds the win probability of a position before a move.
+
+        Returns:
+            A tuple with the lower and upper bounds.
+        """
+        if bb.max_exponent(state) >= self.win_exponent:
+            return 1.0, 1.0
+        key = canonical(state)
+        entry = self.memo.get(key)
+        if entry is not None and (entry[0] >= depth or entry[1] == entry[2]):
+            return entry[1], entry[2]
+        self.nodes += 1
+        lower = upper = 0.0
+        for vertical, reverse in DIRECTIONS:
+            new_state, _ = bb.move(state, vertical, reverse)
+            if new_state == state:
+                continue
+            if depth == 0:
+                # There are moves left, but no more search
+                lower, upper = 0.0, 1.0
+                break
+            move_lower, move_upper = self.expect(new_state, depth)
+            lower = max(lower, move_lower)
+            upper = max(upper, move_upper)
+            if lower == 1.0:
+                break
+        if len(self.memo) < self.max_positions:
+            self.memo[key] = (depth, lower, upper)
+        return lower, upper
+
+    def expect(self, state, depth):
+        """Bounds the win probability of a position after a move."""
+        if bb.max_exponent(state) >= self.win_exponent:
+            return 1.0, 1.0
+        empty = bb.empty_cells(state)
+        lower = upper = 0.0
+        for index in empty:
+            for exponent, probability in self.distribution:
+                weight = probability / len(empty)
+                cell_lower, cell_upper = self.value(
+                    bb.set_cell(state, index, exponent), depth - 1)
+                lower += weight * cell_lower
+                upper += weight * cell_upper
+        return lower, upper
+
+
+def analyze(game: GameBoard, depth=6, win=None, max_positions=2**21,
+            workers=1):
+    """Finds the best move of a 4x4 game and its win probability.
+
+    Args:
+        game: Game to analyze.
+        depth: Maximum number of moves searched.
+        win: Number to reach, the win number of the game if None.
+        max_positions: Maximum number of positions memoized by each
+            process, which bounds memory use.
+        workers: Number of processes. Every spawn after the first move is
+            searched separately.
+
+    Returns:
+        An Analysis.
+
+    Raises:
+        ValueError: The board isn't 4x4.
+    """
+    if game.size != bb.SIZE:
+        raise ValueError('Only 4x4 boards can be analyzed')
+    win = win or game.win
+    distribution = getattr(game.spawner, 'distribution', spawn.DISTRIBUTION)
+    state = bb.pack(game.board)
+    solver = EndgameSolver(win, distribution, max_positions)
+    # Every spawn after each legal first move is a task
+    tasks = []
+    for direction, (vertical, reverse) in enumerate(DIRECTIONS):
+        new_state, _ = bb.move(state, vertical, reverse)
+        if new_state == state or depth == 0:
+            continue
+        if bb.max_exponent(new_state) >= solver.win_exponent:
+            tasks.append((direction, 1.0, new_state, None))
+            continue
+        empty = bb.empty_cells(new_state)
+        for index in empty:
+            for exponent, probability in solver.distribution:
+                tasks.append((direction, probability / len(empty),
+                              bb.set_cell(new_state, index, exponent),
+                              depth - 1))
+    if workers <= 1:
+        _init_worker(win, distribution, max_positions)
+        results = [_analyze_task(task) for task in tasks]
+    else:
+        with mp.Pool(workers, _init_worker,
+                     (win, distribution, max_positions)) as pool:
+            results = pool.map(_analyze_task, tasks)
+    moves = [None] * len(DIRECTIONS)
+    nodes = positions = 0
+    for (direction, weight, _, _), (lower, upper, task_nodes,
+                                    task_positions) in zip(tasks, results):
+        move_lower, move_upper = moves[direction] or (0.0, 0.0)
+        moves[direction] = (move_lower + weight * lower,
+                            move_upper + weight * upper)
+        nodes += task_nodes
+        positions = max(positions, task_positions)
+    legal = [direction for direction in range(len(DIRECTIONS))
+             if moves[direction] is not None]
+    if bb.max_exponent(state) >= solver.win_exponent:
+        return Analysis(None, 1.0, 1.0, tuple(moves), nodes, positions)
+    if not legal:
+        lower, upper = (0.0, 1.0) if depth == 0 and bb.has_moves(state) \
+            else (0.0, 0.0)
+        return Analysis(None, lower, upper, tuple(moves), nodes, positions)
+    best = max(legal, key=lambda direction: moves[direction])
+    return Analysis(best, moves[best][0], max(moves[d][1] for d in legal),
+                    tuple(moves), nodes, positions)
+
+
+# Solver of the current worker process
+_solver = None
+
+
+def _init_worker(win, distribution, max_positions):
+    """Creates the solver of a worker process."""
+    global _solver
+    _solver = EndgameSolver(win, distribution, max_positions)
+
+
+def _analyze_task(task):
+    """Searches the position after a move and a spawn.
+
+    Returns:
+        The bounds of the position, the nodes it searched and the number
+        of memoized positions of the worker.
+    """
+    _, _, state, depth = task
+    nodes = _solver.nodes
+    if depth is None:
+        lower = upper = 1.0
+    else:
+        lower, upper = _solver.value(state, depth)
+    return lower, upper, _solver.nodes - nodes, len(_solver.memo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m 2048 endgame',
+        description='Find the win probability of a 4x4 position with '
+                    'optimal play.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--board', type=int, nargs=16, metavar='N',
+                        help='cell numbers, row by row (0 if blank)')
+    source.add_argument('--snapshot', metavar='FILE',
+                        help='game snapshot written by GameBoard.save')
+    parser.add_argument('--win', type=int, default=None,
+                        help='number to reach (default: the win number of '
+                             'the snapshot, or 2048)')
+    parser.add_argument('--depth', type=int, default=6,
+                        help='maximum number of moves searched')
+    parser.add_argument('--max-positions', type=int, default=2**21,
+                        help='maximum memoized positions per process')
+    parser.add_argument('--workers', type=int, default=mp.cpu_count(),
+                        help='number of worker processes')
+    args = parser.parse_args(argv)
+    if args.snapshot:
+        game = GameBoard.load(args.snapshot)
+    else:
+        game = GameBoard(win=args.win or 2048, test=True)
+        game.board = [args.board[i:i + 4] for i in range(0, 16, 4)]
+    try:
+        analysis = analyze(game, args.depth, args.win, args.max_positions,
+                           args.workers)
+    except ValueError as error:
+        parser.error(str(error))
+    names = ('left', 'right', 'up', 'down')
+    for name, bounds in zip(names, analysis.moves):
+        if bounds is not None:
+            print(f'{name:>5}: {bounds[0]:.6f} - {bounds[1]:.6f}')
+    best = 'none' if analysis.best_move is None else names[analysis.best_move]
+    exact = 'exact' if analysis.upper - analysis.lower < 1e-9 else 'bounds'
+    print(f'Best move: {best}, win probability {analysis.lower:.6f} - '
+          f'{analysis.upper:.6f} ({exact})')
+    print(f'{analysis.nodes} nodes, {analysis.positions} positions')
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import numpy as np
+    from .cache import SYMMETRIES, transform
+    rng = np.random.default_rng(23)
+    # Symmetric boards share their canonical form
+    for _ in range(50):
+        cells = rng.integers(0, 8, (4, 4))
+        layout = np.where(cells > 0, 2**cells, 0)
+        state = bb.pack(layout)
+        assert np.array_equal(bb.unpack(bb.mirror(state)), layout[:, ::-1])
+        assert np.array_equal(bb.unpack(bb.flip(state)), layout[::-1])
+        keys = {canonical(bb.pack(transform(layout, symmetry)))
+                for symmetry in SYMMETRIES}
+        assert len(keys) == 1
+    # A merge away from winning
+    game = GameBoard(test=True)
+    game.board = np.array([[1024, 1024, 0, 0],
+                           [0, 0, 0, 0],
+                           [0, 0, 0, 0],
+                           [0, 0, 0, 0]])
+    analysis = analyze(game, depth=1)
+    assert analysis.best_move in (0, 1)
+    assert analysis.lower == analysis.upper == 1.0
+    assert analysis.moves[2] is None
+    # Stuck boards can't win
+    game.board = np.fromfunction(lambda x, y: 2**(1 + (x + 2 * y) % 6),
+                                 (4, 4), dtype=int)
+    analysis = analyze(game, depth=3)
+    assert analysis.best_move is None and analysis.upper == 0.0
+    # Deeper searches tighten the bounds, and parallel searches agree
+    game.board = np.array([[8, 4, 0, 0],
+                           [2, 16, 2, 4],
+                           [4, 2, 4, 2],
+                           [2, 4, 2, 8]])
+    results = [analyze(game, depth, win=32) for depth in range(1, 5)]
+    for shallow, deep in zip(results, results[1:]):
+        assert shallow.lower <= deep.lower <= deep.upper <= shallow.upper
+        assert shallow.nodes < deep.nodes
+    assert results[0].lower == 0 and results[-1].lower > 0
+    parallel = analyze(game, 4, win=32, workers=2)
+    assert parallel.moves == results[-1].moves
+    assert parallel.best_move == results[-1].best_move
+    # Memoization limits are respected
+    game.board = np.array([[0, 4, 0, 2],
+                           [2, 16, 2, 4],
+                           [4, 0, 4, 2],
+                           [2, 4, 0, 8]])
+    limited = analyze(game, 3, win=32, max_positions=100)
+    unlimited = analyze(game, 3, win=32)
+    assert limited.positions == 100 < unlimited.positions
+    assert np.allclose(limited.moves[limited.best_move],
+                       unlimited.moves[unlimited.best_move])
+    print('All tests passed.')
@@ -0,0 +1,196 @@
+import random as rd
+import numpy as np
+from . import bitboard as bb
+from .batch import BatchBoard
+from .board import GameBoard
+
+
+class GameEnv:
+    """Gym-style environment of a single game.
+
+    Observations are the base 2 logarithms of the cells (0 if blank), and
+    actions are directions (LEFT, RIGHT, UP, DOWN). The reward of a step
+    is the score it gained. Moves that don't change the board are
+    illegal: they get invalid_reward and leave the game as it is.
+
+    The observation and action mask arrays are allocated once and
+    overwritten by every call, so copy them to keep their values.
+    """
+
+    def __init__(self, size=4, win=2048, invalid_reward=0):
+        self.size = size
+        self.win = win
+        self.invalid_reward = invalid_reward
+        self.game = None
+        self._obs = np.zeros((size, size), dtype=np.uint8)
+        self._mask = np.zeros(4, dtype=bool)
+
+    def reset(self, seed=None):
+        """Starts a new game and returns its first observation."""
+        if seed is None:
+            seed = rd.getrandbits(64)
+        # Compact boards already hold the observation, and 4x4 games
+        # use the bitboard engine instead
+        self.game = GameBoard(self.size, self.win, bitboard=True,
+                              compact=True, seed=seed, history_size=0)
+        return self._observe()
+
+    def step(self, action):
+        """Plays a move.
+
+        Returns:
+            A tuple with the observation, the reward, whether the game
+            ended and a dict with the score, move count and whether the
+            move was legal.
+        """
+        game = self.game
+        moves = game.moves
+        score = game.score
+        game.shift(action)
+        legal = game.moves != moves
+        reward = game.score - score if legal else self.invalid_reward
+        done = game.won() or game.lost()
+        return (self._observe(), reward, done,
+                {'score': game.score, 'moves': game.moves, 'legal': legal})
+
+    def action_mask(self):
+        """Returns which actions are legal."""
+        self._mask[:] = self.game.legal_moves()
+        return self._mask
+
+    def _observe(self):
+        """Writes the current observation into its array."""
+        game = self.game
+        if game.bitboard:
+            cells = self._obs.reshape(-1)
+            bits = game._bits
+            for i in range(bb.SIZE * bb.SIZE):
+                cells[i] = (bits >> (4 * i)) & 0xF
+        else:
+            np.copyto(self._obs, game._board)
+        return self._obs
+
+
+class VectorEnv:
+    """Many game environments stepped together with array operations.
+
+    Games run on a BatchBoard. Finished games are reset right away, so
+    the observations of their last step are those of new games, and their
+    final scores are reported in the info dict. All returned arrays are
+    allocated once and overwritten by every call.
+    """
+
+    def __init__(self, count, size=4, win=2048, seed=None,
+                 invalid_reward=0):
+        self.count = count
+        self.size = size
+        self.win = win
+        self.invalid_reward = invalid_reward
+        self.batch = None
+        self._next_seed = None
+        self._obs = np.zeros((count, size, size), dtype=np.uint8)
+        self._logs = np.zeros((count, size, size))
+        self._cells = np.zeros((count, size, size), dtype=np.int64)
+        self._scores = np.zeros(count, dtype=np.int64)
+        self._rewards = np.zeros(count, dtype=np.int64)
+        self._dones = np.zeros(count, dtype=bool)
+        self._masks = np.zeros((count, 4), dtype=bool)
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """Starts new games in every environment.
+
+        Environment i plays the game of seed + i, and later games are
+        seeded with the following numbers.
+
+        Returns:
+            The observations.
+        """
+        if seed is None:
+            seed = rd.getrandbits(64)
+        self.batch = BatchBoard(self.count, self.size, self.win,
+                                seeds=range(seed, seed + self.count))
+        self._next_seed = seed + self.count
+        self._scores[:] = 0
+        return self._observe()
+
+    def step(self, actions):
+        """Plays a move in every environment.
+
+        Returns:
+            A tuple with the observations, rewards, which games ended and
+            a dict with which moves were legal and the final scores of
+            the games that ended.
+        """
+        batch = self.batch
+        legal = batch.shift(actions)
+        np.subtract(batch.score, self._scores, out=self._rewards)
+        self._rewards[~legal] = self.invalid_reward
+        np.copyto(self._dones, batch.done())
+        final_scores = batch.score[self._dones]
+        games = np.flatnonzero(self._dones)
+        if len(games):
+            seeds = range(self._next_seed, self._next_seed + len(games))
+            self._next_seed += len(games)
+            batch.reset(games, seeds)
+        np.copyto(self._scores, batch.score)
+        return (self._observe(), self._rewards, self._dones,
+                {'legal': legal, 'final_scores': final_scores})
+
+    def action_masks(self):
+        """Returns which actions are legal in each environment."""
+        np.copyto(self._masks, self.batch.legal_moves())
+        return self._masks
+
+    def _observe(self):
+        """Writes the current observations into their array."""
+        np.maximum(self.batch.board, 1, out=self._cells)
+        np.log2(self._cells, out=self._logs)
+        np.copyto(self._obs, self._logs, casting='unsafe')
+        return self._obs
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    from .board import to_numbers
+    rng = np.random.default_rng(20)
+    # A single environment plays like a GameBoard
+    for size in (4, 5):
+        env = GameEnv(size)
+        obs = env.reset(seed=8)
+        game = GameBoard(size, seed=8)
+        assert np.array_equal(to_numbers(obs), game.board)
+        done = False
+        while not done:
+            mask = env.action_mask().copy()
+            action = rng.integers(0, 4)
+            score = game.score
+            game.shift(action)
+            obs, reward, done, info = env.step(action)
+            assert obs is env._obs
+            assert np.array_equal(to_numbers(obs), game.board)
+            assert reward == game.score - score
+            assert info['legal'] == mask[action]
+        assert game.lost()
+    # Vectorized environments play like single ones and reset themselves
+    envs = VectorEnv(20, seed=100)
+    singles = [GameEnv() for i in range(20)]
+    for i, env in enumerate(singles):
+        assert np.array_equal(env.reset(seed=100 + i), envs._obs[i])
+    next_seeds = iter(range(120, 10000))
+    finished = 0
+    for _ in range(400):
+        masks = envs.action_masks().copy()
+        actions = rng.integers(0, 4, 20)
+        obs, rewards, dones, info = envs.step(actions)
+        assert np.array_equal(info['legal'], masks[np.arange(20), actions])
+        for i, env in enumerate(singles):
+            single_obs, reward, done, _ = env.step(actions[i])
+            assert reward == rewards[i] and done == dones[i]
+            if done:
+                finished += 1
+                single_obs = env.reset(seed=next(next_seeds))
+            assert np.array_equal(single_obs, obs[i])
+        assert len(info['final_scores']) == dones.sum()
+    assert finished > 0
+    print('All tests passed.')
@@ -1,5 +1,6 @@
-import time
 import sys
+import time
+import numpy as np
 import pygame as pg
 from pygame.locals import *
 from .board import GameBoard
@@ -31,13 +32,29 @@ BLOCK_SIZE = 5 * SEPARATOR_SIZE
 
 
 class GameApp:
-    """Game application object."""
+    """Game application object.
+
+    The screen is only redrawn when something changes, and then only the
+    cells and header fields that changed are updated. Fonts, texts and
+    cell surfaces are created once and reused.
+    """
 
-    def __init__(self, size=4, win=2048):
-        self.game = GameBoard(size, win)
+    def __init__(self, size=4, win=2048, seed=None, profiler=None):
+        self.game = GameBoard(size, win, seed=seed)
+        # Optional Profiler of the game and frames, shown in an overlay
+        self.profiler = profiler
+        if profiler:
+            profiler.attach(self.game)
         self._running = True
         self.width = BLOCK_SIZE * size + SEPARATOR_SIZE * (size + 1)
         self.height = (BLOCK_SIZE + SEPARATOR_SIZE) * (size + 1)
+        self._fonts = {}
+        self._cells = {}
+        # What is currently on the screen, to find out what changed
+        self._drawn_board = None
+        self._drawn_moves = None
+        self._drawn_score = None
+        self._drawn_status = None
 
     def init_game(self):
         """Initializes game loop and screen."""
@@ -45,6 +62,8 @@ class GameApp:
         self._running = True
         self.screen = pg.display.set_mode((self.width, self.height))
         pg.display.set_caption('2048 by S8A')
+        self._init_layout()
+        self._drawn_board = None
     
     def on_event(self, event):
         """Handles events."""
@@ -63,116 +82,179 @@ class GameApp:
                     self.game.shift_down()
             if event.key == K_u and not self.game.won():
                 self.game.undo()
+            elif event.key == K_r and not self.game.won():
+                self.game.redo()
     
     def execute(self):
         """Executes the game loop."""
         # Initialize
         self.init_game()
+        self.render()
         
         while self._running:
-            # Handle events
+            # Sleep until something happens, then handle every
+            # pending event
+            self.on_event(pg.event.wait())
             for event in pg.event.get():
                 self.on_event(event)
 
-            # Fill background
-            self.screen.fill(COLORS['white1'])
-            
-            # Render header
-            self._render_header()
+            # Update what changed
+            start = time.perf_counter()
+            self.render()
+            if self.profiler:
+                self.profiler.record('frame', time.perf_counter() - start)
 
-            # Render board
-            self._render_board()
+        # Quit PyGame after finishing
+        pg.quit()
 
-            # Render win/loss
-            if self.game.won():
+    def render(self):
+        """Draws the changes since the last render on the screen."""
+        status = ('won' if self.game.won()
+                  else 'lost' if self.game.lost() else None)
+        if self._drawn_board is None or status != self._drawn_status:
+            # Draw everything again
+            self.screen.fill(COLORS['white1'])
+            self._render_header(full=True)
+            self._render_board(full=True)
+            if status == 'won':
                 self._render_won()
-            elif self.game.lost():
+            elif status == 'lost':
                 self._render_lost()
-
-            # Refresh screen
+            self._drawn_status = status
+            if self.profiler:
+                self._render_profile()
             pg.display.flip()
+            return
+        # Draw only the fields and cells that changed
+        rects = self._render_header() + self._render_board()
+        if self.profiler:
+            rects.append(self._render_profile())
+        if rects:
+            pg.display.update(rects)
 
-            # Wait a little
-            time.sleep(0.01)
-
-        # Quit PyGame after finishing
-        pg.quit()
-    
-    def _render_header(self):
-        """Renders the header of the game."""
+    def _init_layout(self):
+        """Calculates the rectangles of the header fields and board."""
         # Dimensions of the 2048 title
         title_width = (BLOCK_SIZE * (self.game.size - 2)
                        + SEPARATOR_SIZE * (self.game.size - 3))
         title_height = BLOCK_SIZE - 2 * SEPARATOR_SIZE
-        title_rect = pg.Rect((SEPARATOR_SIZE, SEPARATOR_SIZE),
-                             (title_width, title_height))
+        self._title_rect = pg.Rect((SEPARATOR_SIZE, SEPARATOR_SIZE),
+                                   (title_width, title_height))
         
         # Dimensions of the move counter
-        moves_left_margin = title_rect.right + SEPARATOR_SIZE
-        moves_rect = pg.Rect((moves_left_margin, SEPARATOR_SIZE),
-                             (BLOCK_SIZE, title_height))
+        moves_left_margin = self._title_rect.right + SEPARATOR_SIZE
+        self._moves_rect = pg.Rect((moves_left_margin, SEPARATOR_SIZE),
+                                   (BLOCK_SIZE, title_height))
                             
         # Dimensions of the scoreboard
-        score_left_margin = moves_rect.right + SEPARATOR_SIZE
-        score_rect = pg.Rect((score_left_margin, SEPARATOR_SIZE),
-                             (BLOCK_SIZE, title_height))
+        score_left_margin = self._moves_rect.right + SEPARATOR_SIZE
+        self._score_rect = pg.Rect((score_left_margin, SEPARATOR_SIZE),
+                                   (BLOCK_SIZE, title_height))
+
+        # Game board rectangle
+        self._board_rect = pg.Rect((0, BLOCK_SIZE),
+                                   (self.width, self.width))
+    
+    def _render_header(self, full=False):
+        """Renders the header fields that changed, or all of them.
 
-        # Render title text
-        title_text = self._create_text('2048', 48, 'brown', bold=True)
-        title_text_rect = title_text.get_rect(center=title_rect.center)
+        Returns:
+            The rectangles of the screen that were updated.
+        """
+        rects = []
+        if full:
+            # Render title text
+            title_text = self._create_text('2048', 48, 'brown', bold=True)
+            title_text_rect = title_text.get_rect(
+                center=self._title_rect.center)
+            self.screen.blit(title_text, title_text_rect)
+            self._drawn_moves = self._drawn_score = None
 
         # Render the move counter
-        moves_text = self._create_text(
-            f'Moves: {self.game.moves}', 16, 'brown')
-        moves_text_rect = moves_text.get_rect(center=moves_rect.center)
+        if self.game.moves != self._drawn_moves:
+            self._drawn_moves = self.game.moves
+            rects.append(self._render_field(
+                f'Moves: {self.game.moves}', self._moves_rect))
 
         # Render the score counter
-        score_text = self._create_text(
-            f'Score: {self.game.get_score()}', 16, 'brown')
-        score_text_rect = score_text.get_rect(center=score_rect.center)
+        score = self.game.get_score()
+        if score != self._drawn_score:
+            self._drawn_score = score
+            rects.append(self._render_field(
+                f'Score: {score}', self._score_rect))
+        return rects
 
-        # Blit text elements onto the screen
-        self.screen.blit(title_text, title_text_rect)
-        self.screen.blit(moves_text, moves_text_rect)
-        self.screen.blit(score_text, score_text_rect)
+    def _render_field(self, text, rect):
+        """Renders a text field of the header over a clean background."""
+        self.screen.fill(COLORS['white1'], rect)
+        text = self._create_text(text, 16, 'brown')
+        self.screen.blit(text, text.get_rect(center=rect.center))
+        return rect
 
-    def _render_board(self):
-        """Renders the game board."""
-        # Game board rectangle
-        board_rect = pg.Rect((0, BLOCK_SIZE),
-                             (self.width, self.width))
-        pg.draw.rect(self.screen, COLORS['beige0'], board_rect)
-        
-        # Iterate over cells
-        row = 0
-        while row < self.game.size:
-            col = 0
-            while col < self.game.size:
-                cell = self.game.board[row][col]
-                # Calculate position
-                left_margin = col * BLOCK_SIZE + (col + 1) * SEPARATOR_SIZE
-                top_margin = (board_rect.top
-                              + row * BLOCK_SIZE
-                              + (row + 1) * SEPARATOR_SIZE)
-                # Cell rectangle
-                cell_rect = pg.Rect((left_margin, top_margin),
-                                    (BLOCK_SIZE, BLOCK_SIZE))
-                # Set cell color
-                bg = COLORS['beige1']
-                if cell in COLORS['cell'].keys():
-                    bg = COLORS['cell'][cell]
-                elif cell > 2048:
-                    bg = COLORS['cell'][2048]
-                # Draw cell
-                pg.draw.rect(self.screen, bg, cell_rect)
-                # Cell number
-                if cell != 0:
-                    color = 'brown' if cell < 8 else 'white0'
-                    number = self._create_text(str(cell), 28, color, bold=True)
-                    number_rect = number.get_rect(center=cell_rect.center)
-                    self.screen.blit(number, number_rect)                
-                col += 1
-            row += 1
+    def _render_profile(self):
+        """Renders the last frame and move timings above the header.
+
+        Returns:
+            The rectangle of the screen that was updated.
+        """
+        rect = pg.Rect((0, 0), (self.width, SEPARATOR_SIZE))
+        self.screen.fill(COLORS['white1'], rect)
+        frame = 1e3 * self.profiler.last.get('frame', 0.0)
+        move = 1e3 * self.profiler.last.get('shift', 0.0)
+        text = self._create_text(f'frame {frame:.2f} ms  move {move:.2f} ms',
+                                 12, 'brown')
+        self.screen.blit(text, text.get_rect(midleft=(4, rect.centery)))
+        return rect
+
+    def _render_board(self, full=False):
+        """Renders the cells that changed, or the whole board.
+
+        Returns:
+            The rectangles of the screen that were updated.
+        """
+        board = self.game.board
+        if full:
+            pg.draw.rect(self.screen, COLORS['beige0'], self._board_rect)
+            changed = np.argwhere(np.ones_like(board, dtype=bool))
+        else:
+            changed = np.argwhere(board != self._drawn_board)
+        rects = []
+        for row, col in changed:
+            cell_rect = self._cell_rect(row, col)
+            self.screen.blit(self._cell_surface(board[row][col]), cell_rect)
+            rects.append(cell_rect)
+        self._drawn_board = board.copy()
+        return rects
+
+    def _cell_rect(self, row, col):
+        """Returns the rectangle of a cell on the screen."""
+        left_margin = col * BLOCK_SIZE + (col + 1) * SEPARATOR_SIZE
+        top_margin = (self._board_rect.top
+                      + row * BLOCK_SIZE
+                      + (row + 1) * SEPARATOR_SIZE)
+        return pg.Rect((left_margin, top_margin), (BLOCK_SIZE, BLOCK_SIZE))
+
+    def _cell_surface(self, cell):
+        """Returns the pre-rendered surface of a cell number."""
+        surface = self._cells.get(cell)
+        if surface is None:
+            # Set cell color
+            bg = COLORS['beige1']
+            if cell in COLORS['cell'].keys():
+                bg = COLORS['cell'][cell]
+            elif cell > 2048:
+                bg = COLORS['cell'][2048]
+            # Draw cell
+            surface = pg.Surface((BLOCK_SIZE, BLOCK_SIZE))
+            surface.fill(bg)
+            # Cell number
+            if cell != 0:
+                color = 'brown' if cell < 8 else 'white0'
+                number = self._create_text(str(cell), 28, color, bold=True)
+                number_rect = number.get_rect(center=surface.get_rect().center)
+                surface.blit(number, number_rect)
+            self._cells[cell] = surface
+        return surface
 
     def _render_won(self):
         """Renders the win screen."""
@@ -198,10 +280,14 @@ class GameApp:
 
     def _create_text(self, text, size, color, bold=False, italic=False):
         """Creates a text object with the given properties."""
-        font = pg.font.SysFont('Arial', size, bold=bold, italic=italic)
+        key = (size, bold, italic)
+        font = self._fonts.get(key)
+        if font is None:
+            font = pg.font.SysFont('Arial', size, bold=bold, italic=italic)
+            self._fonts[key] = font
         return font.render(text, True, COLORS[color])
 
 
-def main(size=4, win=2048):
-    app = GameApp(size, win)
+def main(size=4, win=2048, profiler=None):
+    app = GameApp(size, win, profiler=profiler)
     app.execute()
@@ -0,0 +1,209 @@
+import argparse
+import os
+import random as rd
+import time
+from collections import defaultdict
+import numpy as np
+import pygame as pg
+from .gui import GameApp
+
+# Script tokens, the same actions the CLI accepts, and their keys
+KEYS = {'l': pg.K_LEFT,
+        'r': pg.K_RIGHT,
+        'u': pg.K_UP,
+        'd': pg.K_DOWN,
+        'undo': pg.K_u,
+        'redo': pg.K_r}
+
+
+class HeadlessApp(GameApp):
+    """Game application that renders off-screen and times every frame.
+
+    Uses the SDL dummy video driver, so it runs without a display. Each
+    frame records the time spent in the whole render and in each of the
+    header, board and overlay renderers, and whether the board was drawn
+    in full.
+    """
+
+    def __init__(self, size=4, win=2048, seed=None, full=False):
+        super().__init__(size, win, seed)
+        self.full = full
+        self.frames = []
+        self._frame = None
+
+    def init_game(self):
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        super().init_game()
+
+    def play(self, script, frames_dir=None):
+        """Plays a list of actions, rendering a frame after each one.
+
+        Args:
+            script: Sequence of actions (l, r, u, d, undo or redo).
+            frames_dir: If given, directory to save every frame as PNG.
+        """
+        self.init_game()
+        if frames_dir:
+            os.makedirs(frames_dir, exist_ok=True)
+        self._timed_render()
+        for i, action in enumerate(script):
+            self.on_event(pg.event.Event(pg.KEYDOWN, key=KEYS[action]))
+            if self.full:
+                # Force a redraw of the whole screen
+                self._drawn_board = None
+            self._timed_render()
+            if frames_dir:
+                pg.image.save(self.screen, os.path.join(
+                    frames_dir, f'frame_{i:05d}.png'))
+        pg.quit()
+
+    def summary(self):
+        """Frame time statistics, in milliseconds."""
+        frames = np.array([frame['render'] for frame in self.frames]) * 1000
+        parts = defaultdict(float)
+        for frame in self.frames:
+            for name, seconds in frame.items():
+                if name not in ('render', 'full'):
+                    parts[name] += seconds
+        return {'size': self.game.size,
+                'frames': len(frames),
+                'full_frames': sum(frame.get('full', False)
+                                   for frame in self.frames),
+                'fps': 1000 / frames.mean(),
+                'mean_ms': float(frames.mean()),
+                'p50_ms': float(np.percentile(frames, 50)),
+                'p95_ms': float(np.percentile(frames, 95)),
+                'max_ms': float(frames.max()),
+                'parts_ms': {name.lstrip('_'): 1000 * total / len(frames)
+                             for name, total in parts.items()}}
+
+    def _timed_render(self):
+        """Renders a frame and stores its timings."""
+        self._frame = {}
+        start = time.perf_counter()
+        self.render()
+        self._frame['render'] = time.perf_counter() - start
+        self.frames.append(self._frame)
+
+    def _timed(self, name, method, *args, **kwargs):
+        """Calls a render method, adding its duration to the frame."""
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        self._frame[name] = (self._frame.get(name, 0.0)
+                             + time.perf_counter() - start)
+        return result
+
+    def _render_header(self, full=False):
+        return self._timed('_render_header', super()._render_header, full)
+
+    def _render_board(self, full=False):
+        self._frame['full'] = full
+        return self._timed('_render_board', super()._render_board, full)
+
+    def _render_won(self):
+        return self._timed('_render_won', super()._render_won)
+
+    def _render_lost(self):
+        return self._timed('_render_lost', super()._render_lost)
+
+
+def parse_script(tokens):
+    """Checks the actions of a script written for the CLI.
+
+    print is skipped, since every action renders a frame anyway, and exit
+    ends the script.
+
+    Returns:
+        The list of actions to play.
+
+    Raises:
+        ValueError: An action is invalid.
+    """
+    script = []
+    for count, token in enumerate(tokens, 1):
+        if token == 'exit':
+            break
+        if token in KEYS:
+            script.append(token)
+        elif token != 'print':
+            raise ValueError(f'invalid action {token!r} (action {count})')
+    return script
+
+
+def random_script(length, seed=0):
+    """Creates a script of random shifts."""
+    rng = rd.Random(seed)
+    return [rng.choice('lrud') for i in range(length)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m 2048 headless',
+        description='Benchmark the GUI rendering without a display.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4, 8, 16, 32],
+                        help='board sizes to benchmark')
+    parser.add_argument('--moves', type=int, default=200,
+                        help='number of random moves per board')
+    parser.add_argument('--script', type=argparse.FileType('r'),
+                        help='file of actions (l/r/u/d/undo/redo) to play '
+                             'instead of random moves')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the games and random moves')
+    parser.add_argument('--full', action='store_true',
+                        help='redraw the whole screen on every frame')
+    parser.add_argument('--frames', metavar='DIR',
+                        help='save every frame as PNG in this directory')
+    args = parser.parse_args(argv)
+    if args.script:
+        try:
+            script = parse_script(args.script.read().split())
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        script = random_script(args.moves, args.seed)
+    for size in args.sizes:
+        app = HeadlessApp(size, seed=args.seed, full=args.full)
+        frames_dir = args.frames and os.path.join(args.frames, f'{size}x{size}')
+        app.play(script, frames_dir)
+        summary = app.summary()
+        parts = ', '.join(f'{name} {ms:.3f}'
+                          for name, ms in summary['parts_ms'].items())
+        print(f"{size}x{size}: {summary['fps']:.0f} fps, "
+              f"mean {summary['mean_ms']:.3f} ms, "
+              f"p95 {summary['p95_ms']:.3f} ms, "
+              f"max {summary['max_ms']:.3f} ms ({parts})")
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import tempfile
+    script = random_script(30, seed=10) + ['undo', 'redo']
+    # Every frame times the board, and full frames redraw all of it
+    for full in (False, True):
+        app = HeadlessApp(4, seed=10, full=full)
+        app.play(script)
+        assert len(app.frames) == len(script) + 1
+        assert all('_render_board' in frame for frame in app.frames)
+        assert app.frames[0]['full']
+        assert all(frame['full'] == full for frame in app.frames[1:]
+                   if '_render_won' not in frame
+                   and '_render_lost' not in frame)
+        summary = app.summary()
+        assert summary['frames'] == len(script) + 1
+        assert set(summary['parts_ms']) == {'render_header',
+                                            'render_board'}
+        if full:
+            assert summary['full_frames'] == summary['frames']
+    # Scripts of the CLI play their actions until exit
+    assert parse_script(['l', 'print', 'undo', 'exit', 'r']) == ['l', 'undo']
+    try:
+        parse_script(['l', 'jump'])
+        assert False
+    except ValueError:
+        pass
+    # Frames are saved once per action
+    frames_dir = tempfile.mkdtemp()
+    HeadlessApp(4, seed=10).play(script[:5], frames_dir)
+    assert sorted(os.listdir(frames_dir)) == [f'frame_{i:05d}.png'
+                                              for i in range(5)]
+    print('All tests passed.')
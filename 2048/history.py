@@ -0,0 +1,67 @@
+from collections import deque, namedtuple
+
+# Change made by a single move. With the NumPy engine, cells holds the flat
+# indices of the changed cells and before/after their numbers; with the
+# bitboard engine, cells is None and before/after are the packed boards.
+Step = namedtuple('Step', ['cells', 'before', 'after',
+                           'score_before', 'score_after',
+                           'max_before', 'max_after'])
+
+
+class History:
+    """Undo/redo history of a game, kept in a bounded ring buffer.
+
+    When the buffer is full, the oldest steps are forgotten, so memory
+    use and the cost of each move don't depend on the length of the game.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self._done = deque(maxlen=capacity)
+        self._undone = []
+
+    def __len__(self):
+        """Number of steps that can be undone."""
+        return len(self._done)
+
+    @property
+    def redo_count(self):
+        """Number of steps that can be redone."""
+        return len(self._undone)
+
+    def push(self, step: Step):
+        """Adds the step of a new move, forgetting any undone steps."""
+        self._done.append(step)
+        self._undone.clear()
+
+    def undo(self):
+        """Returns the last step done, marking it as undone."""
+        step = self._done.pop()
+        self._undone.append(step)
+        return step
+
+    def redo(self):
+        """Returns the last step undone, marking it as done again."""
+        step = self._undone.pop()
+        self._done.append(step)
+        return step
+
+    def last(self):
+        """Returns the last step done, or None."""
+        return self._done[-1] if self._done else None
+
+    def steps(self):
+        """Returns the lists of done steps, oldest first, and undone steps,
+        the next one to redo last."""
+        return list(self._done), list(self._undone)
+
+    def restore(self, done, undone):
+        """Replaces every step with the given ones, as returned by steps."""
+        self._done.clear()
+        self._done.extend(done)
+        self._undone = list(undone)
+
+    def clear(self):
+        """Forgets every step."""
+        self._done.clear()
+        self._undone.clear()
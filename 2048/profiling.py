@@ -0,0 +1,163 @@
+import json
+import sys
+import time
+from collections import defaultdict
+from .board import DIRECTIONS
+
+# Names of the shift directions, in DIRECTIONS order
+DIRECTION_NAMES = ('left', 'right', 'up', 'down')
+# GameBoard methods timed by Profiler.attach
+TIMED = ('_shift', '_reduce', '_add_new_cell', '_no_moves_left', 'undo',
+         'redo')
+
+
+class Profiler:
+    """Operation counters and timing histograms of GameBoards.
+
+    Games are instrumented by attach, which wraps the hot methods of the
+    instance only, so games without a profiler run exactly the same code
+    as before. Timings are kept in histograms of power-of-two buckets of
+    microseconds, besides their count, total and maximum.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = {}
+        # Duration of the last call of every timed operation, in seconds
+        self.last = {}
+        self.started = time.perf_counter()
+
+    def count(self, name, amount=1):
+        """Adds to a counter."""
+        self.counters[name] += amount
+
+    def record(self, name, seconds):
+        """Adds a duration to the timings of an operation."""
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = {'count': 0, 'total': 0.0,
+                                           'max': 0.0,
+                                           'histogram': defaultdict(int)}
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+        timing['histogram'][int(seconds * 1e6).bit_length()] += 1
+        self.last[name] = seconds
+
+    def attach(self, game):
+        """Instruments a game, returning it."""
+        for name in TIMED:
+            setattr(game, name, self._timed(name.lstrip('_'),
+                                            getattr(game, name)))
+        shift = game._shift
+        no_moves_left = game._no_moves_left
+        add_new_cell = game._add_new_cell
+
+        def counted_shift(vertical, reverse):
+            moves = game.moves
+            empty = game._empty
+            spawns = self.counters['spawns']
+            shift(vertical, reverse)
+            direction = DIRECTION_NAMES[DIRECTIONS.index((vertical,
+                                                          reverse))]
+            self.count(f'shifts_{direction}')
+            if game.moves == moves:
+                self.count('noop_shifts')
+            else:
+                # Every merge frees a cell and every spawn takes one
+                spawned = self.counters['spawns'] - spawns
+                self.count('merges', game._empty - empty + spawned)
+
+        def counted_no_moves_left():
+            self.count('status_checks')
+            if game._movable is not None:
+                self.count('status_cache_hits')
+            return no_moves_left()
+
+        def counted_add_new_cell():
+            cell = add_new_cell()
+            if cell is not None:
+                self.count('spawns')
+            return cell
+
+        game._shift = counted_shift
+        game._no_moves_left = counted_no_moves_left
+        game._add_new_cell = counted_add_new_cell
+        return game
+
+    def detach(self, game):
+        """Removes the instrumentation of a game."""
+        for name in TIMED:
+            game.__dict__.pop(name, None)
+
+    def summary(self):
+        """Returns the counters and timings as a JSON-serializable dict."""
+        timings = {}
+        for name, timing in sorted(self.timings.items()):
+            histogram = {f'<{1 << bucket}us': count for bucket, count
+                         in sorted(timing['histogram'].items())}
+            timings[name] = {'count': timing['count'],
+                             'total_ms': 1e3 * timing['total'],
+                             'mean_us': 1e6 * timing['total']
+                             / timing['count'],
+                             'max_us': 1e6 * timing['max'],
+                             'histogram': histogram}
+        return {'seconds': time.perf_counter() - self.started,
+                'counters': dict(sorted(self.counters.items())),
+                'timings': timings}
+
+    def save(self, path):
+        """Writes the summary as JSON to a file, or to stderr if path is -."""
+        text = json.dumps(self.summary(), indent=2)
+        if path == '-':
+            print(text, file=sys.stderr)
+        else:
+            with open(path, 'w') as file:
+                file.write(text + '\n')
+
+    def _timed(self, name, method):
+        """Wraps a method so that every call is timed."""
+        record = self.record
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record(name, clock() - start)
+        return timed
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import numpy as np
+    from .board import GameBoard
+    rng = np.random.default_rng(21)
+    # Profiled games play like the others and count what they do
+    for options in ({}, {'bitboard': True}):
+        profiler = Profiler()
+        games = [profiler.attach(GameBoard(seed=2, **options)),
+                 GameBoard(seed=2, **options)]
+        while not games[1].lost():
+            direction = rng.integers(0, 4)
+            for game in games:
+                game.shift(direction)
+        assert games[0].lost() and games[0].score == games[1].score
+        games[0].undo()
+        counters = profiler.counters
+        shifts = sum(counters[f'shifts_{name}'] for name in DIRECTION_NAMES)
+        assert shifts == profiler.timings['shift']['count']
+        assert shifts - counters['noop_shifts'] == games[1].moves
+        # The first cell is added before the profiler is attached
+        assert counters['spawns'] == games[1].moves
+        assert (counters['spawns'] + 1 - counters['merges']
+                == np.count_nonzero(games[1].board))
+        assert profiler.timings['undo']['count'] == 1
+        summary = json.loads(json.dumps(profiler.summary()))
+        shift = summary['timings']['shift']
+        assert sum(shift['histogram'].values()) == shift['count']
+        assert ('reduce' in summary['timings']) != bool(options)
+        profiler.detach(games[0])
+        assert '_shift' not in games[0].__dict__
+    print('All tests passed.')
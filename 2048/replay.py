@@ -0,0 +1,246 @@
+import mmap
+import struct
+from . import spawn
+from .board import GameBoard
+
+# A replay file starts with MAGIC and holds any number of games. Each game
+# is a header with the board size, win number, seed and record count,
+# followed by fixed-size records. A record packs an action in its low 3
+# bits, whether the new cell was a 4 (instead of a 2) in the next bit and
+# the flat index of the new cell in the rest, so 4x4 games take one byte
+# per move. The first record of a game holds the initial cell.
+MAGIC = b'2048RPL\x01'
+HEADER = struct.Struct('<HQQI')
+UNDO = 4
+START = 5
+REDO = 6
+
+
+def record_size(size):
+    """Returns the number of bytes of a record for NxN boards."""
+    bits = 4 + (size * size - 1).bit_length()
+    return (bits + 7) // 8
+
+
+class ReplayWriter:
+    """Streams the games of GameBoards created with it as recorder.
+
+    Games are appended to the file one after the other, each one written
+    when the next one starts or the writer is closed.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._header = None
+        self._records = bytearray()
+        self._record_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, game: GameBoard, cell):
+        """Starts recording a new game, given its initial cell."""
+        if game.test_mode:
+            raise ValueError('Games in test mode cannot be recorded')
+        self.flush()
+        self._header = (game.size, game.win, game.seed & spawn.MASK64)
+        self._record_size = record_size(game.size)
+        self._append(START, cell)
+
+    def move(self, direction, cell):
+        """Records a shift and the cell it added."""
+        self._append(direction, cell)
+
+    def undo(self):
+        """Records an undo action."""
+        self._append(UNDO, None)
+
+    def redo(self):
+        """Records a redo action."""
+        self._append(REDO, None)
+
+    def flush(self):
+        """Writes the game being recorded, if any."""
+        if self._header is None:
+            return
+        count = len(self._records) // self._record_size
+        self._file.write(HEADER.pack(*self._header, count))
+        self._file.write(self._records)
+        self._file.flush()
+        self._header = None
+        self._records = bytearray()
+
+    def close(self):
+        """Writes the last game and closes the file."""
+        self.flush()
+        self._file.close()
+
+    def _append(self, action, cell):
+        """Encodes a record and adds it to the current game."""
+        code = action
+        if cell is not None:
+            index, value = cell
+            if value not in (2, 4):
+                raise ValueError(f'Cannot record spawned number {value}')
+            code |= (value == 4) << 3 | index << 4
+        self._records += code.to_bytes(self._record_size, 'little')
+
+
+class GameReplay:
+    """Lazy view of a recorded game inside a replay file."""
+
+    def __init__(self, data, offset):
+        self.size, self.win, self.seed, self.count = HEADER.unpack_from(
+            data, offset)
+        self.record_size = record_size(self.size)
+        self._data = data
+        self._start = offset + HEADER.size
+        self.end = self._start + self.count * self.record_size
+
+    def __len__(self):
+        """Number of actions (shifts, undos and redos) of the game."""
+        return self.count - 1
+
+    def records(self):
+        """Yields the (action, cell) records of the game."""
+        data = self._data
+        step = self.record_size
+        for offset in range(self._start, self.end, step):
+            code = int.from_bytes(data[offset:offset + step], 'little')
+            action = code & 7
+            if action in (UNDO, REDO):
+                yield action, None
+            else:
+                yield action, (code >> 4, 4 if code & 8 else 2)
+
+    def actions(self):
+        """Yields the actions (directions, UNDO or REDO) of the game."""
+        records = self.records()
+        next(records)
+        for action, _ in records:
+            yield action
+
+    def board_at(self, move=None):
+        """Replays the game up to the given action.
+
+        Only one board is kept, so intermediate positions are never
+        stored.
+
+        Args:
+            move: Number of actions to replay. If None, replays the whole
+                game.
+
+        Returns:
+            The GameBoard after those actions.
+        """
+        spawns = (cell for _, cell in self.records() if cell is not None)
+        game = GameBoard(self.size, self.win, bitboard=True, seed=self.seed,
+                         spawner=spawn.ReplaySpawner(spawns))
+        for i, action in enumerate(self.actions()):
+            if move is not None and i >= move:
+                break
+            if action == UNDO:
+                game.undo()
+            elif action == REDO:
+                game.redo()
+            else:
+                game.shift(action)
+        return game
+
+
+class ReplayFile:
+    """Memory-mapped reader of a replay file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a replay file')
+        self._offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        """Yields every game of the file, in order."""
+        offset = len(MAGIC)
+        while offset < len(self._data):
+            game = GameReplay(self._data, offset)
+            yield game
+            offset = game.end
+
+    def __len__(self):
+        return len(self._index())
+
+    def __getitem__(self, index):
+        return GameReplay(self._data, self._index()[index])
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _index(self):
+        """Returns the offsets of every game, scanning the file once."""
+        if self._offsets is None:
+            offsets = []
+            offset = len(MAGIC)
+            while offset < len(self._data):
+                offsets.append(offset)
+                size, _, _, count = HEADER.unpack_from(self._data, offset)
+                offset += HEADER.size + count * record_size(size)
+            self._offsets = offsets
+        return self._offsets
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import os
+    import random as rd
+    import tempfile
+    import numpy as np
+    path = os.path.join(tempfile.mkdtemp(), 'games.rpl')
+    # Record some games with shifts and undos
+    rng = rd.Random(0)
+    boards = []
+    with ReplayWriter(path) as writer:
+        for seed, size in ((1, 4), (2, 8), (3, 4)):
+            game = GameBoard(size, recorder=writer, seed=seed)
+            for _ in range(200):
+                if rng.random() < 0.1:
+                    game.undo()
+                elif rng.random() < 0.05:
+                    game.redo()
+                else:
+                    game.shift(rng.randrange(4))
+            boards.append(game)
+    # Read them back
+    with ReplayFile(path) as replays:
+        assert len(replays) == 3
+        assert [replay.seed for replay in replays] == [1, 2, 3]
+        assert os.path.getsize(path) < len(MAGIC) + 3 * (HEADER.size + 2 * 201)
+        for game, replay in zip(boards, replays):
+            assert replay.size == game.size
+            replayed = replay.board_at()
+            assert np.array_equal(replayed.board, game.board)
+            assert replayed.score == game.score
+        # Jump to an intermediate move
+        replay = replays[0]
+        game = replay.board_at(10)
+        actions = list(replay.actions())[:10]
+        assert game.moves == sum(-1 if a == UNDO else 1 for a in actions)
+        # Undone positions can be redone
+        game = replays[1].board_at()
+        moves = game.moves
+        game.jump_to(moves - 5)
+        game.jump_to(moves)
+        assert np.array_equal(game.board, boards[1].board)
+    print('All tests passed.')
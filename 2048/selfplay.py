@@ -0,0 +1,203 @@
+import argparse
+import multiprocessing as mp
+import random as rd
+import time
+from collections import namedtuple
+import numpy as np
+from . import ai
+from .board import GameBoard, LEFT, RIGHT, UP, DOWN
+
+
+# Compact result of a single game
+GameRecord = namedtuple('GameRecord', ['score', 'moves', 'max_tile', 'seconds'])
+# Tiles whose reach rates are summarized
+TILE_THRESHOLDS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def random_strategy(game, rng):
+    """Tries the directions in random order."""
+    directions = [LEFT, RIGHT, UP, DOWN]
+    rng.shuffle(directions)
+    return directions
+
+
+def corner_strategy(game, rng):
+    """Keeps the big numbers in the top left corner when possible."""
+    return [LEFT, UP, RIGHT, DOWN]
+
+
+class ExpectimaxStrategy:
+    """Plays the move chosen by the expectimax AI."""
+
+    def __init__(self, depth=2):
+        self.player = ai.ExpectimaxPlayer(depth=depth)
+
+    def __call__(self, game, rng):
+        return [self.player.choose(game)]
+
+
+STRATEGIES = {'random': random_strategy,
+              'corner': corner_strategy,
+              'expectimax': ExpectimaxStrategy}
+
+# Strategy used by the current worker process
+_strategy = None
+
+
+def make_strategy(name, depth=2):
+    """Creates a strategy from its name."""
+    if name == 'expectimax':
+        return ExpectimaxStrategy(depth)
+    return STRATEGIES[name]
+
+
+def play_move(strategy, game, rng):
+    """Plays the first direction of a strategy that moves something.
+
+    Returns:
+        The direction played, or None if none of them moved anything.
+    """
+    moves = game.moves
+    for direction in strategy(game, rng):
+        if direction is not None:
+            game.shift(direction)
+            if game.moves != moves:
+                return direction
+    return None
+
+
+def play_game(strategy, seed, size=4, win=None):
+    """Plays a whole seeded game with the given strategy.
+
+    Args:
+        strategy: Function that takes the game and a random generator and
+            returns the directions to try, in order of preference.
+        seed: Seed of both the board and the strategy.
+        size: Size of the board.
+        win: Cell number that ends the game. If None, plays until lost.
+
+    Returns:
+        The GameRecord of the game.
+    """
+    start = time.perf_counter()
+    rng = rd.Random(seed)
+    game = GameBoard(size, win or 1 << 62, bitboard=True, seed=seed)
+    while not game.won() and not game.lost():
+        if play_move(strategy, game, rng) is None:
+            # None of the directions moved anything
+            break
+    return GameRecord(game.score, game.moves, int(game.board.max()),
+                      time.perf_counter() - start)
+
+
+def run(games, workers=1, strategy='random', seed=0, size=4, win=None,
+        depth=2):
+    """Plays many games across a pool of processes.
+
+    Game i is seeded with seed + i, so results don't depend on the number
+    of workers.
+
+    Returns:
+        A tuple with the list of GameRecords, in game order, and the total
+        wall time in seconds.
+    """
+    start = time.perf_counter()
+    tasks = [(seed + i, size, win) for i in range(games)]
+    if workers <= 1:
+        _init_worker(strategy, depth)
+        records = [_play_task(task) for task in tasks]
+    else:
+        chunksize = max(1, games // (workers * 8))
+        with mp.Pool(workers, _init_worker, (strategy, depth)) as pool:
+            records = list(pool.imap(_play_task, tasks, chunksize))
+    return records, time.perf_counter() - start
+
+
+def summarize(records, elapsed):
+    """Aggregates game records into win rates and score percentiles.
+
+    Without records, the rates are 0 and the means and percentiles NaN.
+    """
+    scores = np.array([record.score for record in records], dtype=float)
+    tiles = np.array([record.max_tile for record in records], dtype=np.int64)
+    moves = np.array([record.moves for record in records], dtype=float)
+    nan = float('nan')
+    thresholds = {tile: float((tiles >= tile).mean()) if records else 0.0
+                  for tile in TILE_THRESHOLDS}
+    percentiles = {p: float(np.percentile(scores, p)) if records else nan
+                   for p in (10, 25, 50, 75, 90, 99)}
+    return {'games': len(records),
+            'games_per_second': len(records) / elapsed if elapsed else 0.0,
+            'mean_score': float(scores.mean()) if records else nan,
+            'mean_moves': float(moves.mean()) if records else nan,
+            'tile_rates': thresholds,
+            'score_percentiles': percentiles}
+
+
+def print_summary(summary):
+    print(f"Games: {summary['games']} "
+          f"({summary['games_per_second']:.1f} games/s)")
+    print(f"Mean score: {summary['mean_score']:.0f}, "
+          f"mean moves: {summary['mean_moves']:.0f}")
+    print('Reached tile:')
+    for tile, rate in summary['tile_rates'].items():
+        print(f'  {tile:>6}: {100 * rate:5.1f}%')
+    print('Score percentiles:')
+    for percentile, score in summary['score_percentiles'].items():
+        print(f'  p{percentile:<2}: {score:.0f}')
+
+
+def _init_worker(strategy, depth):
+    """Creates the strategy of a worker process."""
+    global _strategy
+    _strategy = make_strategy(strategy, depth)
+
+
+def _play_task(task):
+    """Plays the game described by a (seed, size, win) task."""
+    seed, size, win = task
+    return play_game(_strategy, seed, size, win)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m 2048 bench',
+        description='Play many games and aggregate their results.')
+    parser.add_argument('--games', type=int, default=1000,
+                        help='number of games to play')
+    parser.add_argument('--workers', type=int, default=mp.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--strategy', choices=STRATEGIES.keys(),
+                        default='random', help='strategy to play with')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='search depth of the expectimax strategy')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first game')
+    parser.add_argument('--size', type=int, default=4,
+                        help='size of the board')
+    parser.add_argument('--win', type=int, default=None,
+                        help='cell number that ends a game (default: '
+                             'play until lost)')
+    args = parser.parse_args(argv)
+    if args.strategy == 'expectimax' and args.size != 4:
+        parser.error('the expectimax strategy only plays 4x4 boards')
+    records, elapsed = run(args.games, args.workers, args.strategy,
+                           args.seed, args.size, args.win, args.depth)
+    print_summary(summarize(records, elapsed))
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    # Results don't depend on the number of workers, besides the timings
+    records = [[record._replace(seconds=0) for record in run(12, workers)[0]]
+               for workers in (1, 2)]
+    assert records[0] == records[1]
+    assert [record.score for record in records[0]] == \
+        [play_game(random_strategy, seed).score for seed in range(12)]
+    summary = summarize(records[0], 1.0)
+    assert list(summary['tile_rates']) == list(TILE_THRESHOLDS)
+    assert summary['tile_rates'][64] >= summary['tile_rates'][128]
+    # Nothing to summarize
+    summary = summarize([], 0.0)
+    assert summary['games'] == 0 and summary['tile_rates'][64] == 0.0
+    print('All tests passed.')
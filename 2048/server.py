@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import random as rd
+from . import spawn
+from .board import GameBoard, VECTOR_SIZE
+from .cli import game_state
+
+# Shift actions of the protocol, the same ones the CLI accepts
+DIRECTIONS = {'l': 0, 'r': 1, 'u': 2, 'd': 3,
+              'left': 0, 'right': 1, 'up': 2, 'down': 3}
+# Longest request line accepted, which also bounds the read buffer
+LINE_LIMIT = 4096
+
+
+class GameServer:
+    """Asyncio server that hosts a game per connection.
+
+    The protocol is made of JSON lines. Clients send objects with an
+    action ("new", "shift", "undo", "redo", "state" or "quit") and the
+    server replies to each with the state of the game, or with an object
+    holding an error. The state is also sent when a client connects.
+
+    Sessions are closed when idle for too long, each one keeps a bounded
+    undo history on a board of at most max_size cells a side, and replies
+    wait for the client to read them, so slow clients can't make the
+    server buffer without limit.
+    """
+
+    def __init__(self, size=4, win=2048, seed=None, idle_timeout=300.0,
+                 max_sessions=20000, history_size=100, max_size=64):
+        self.size = size
+        self.win = win
+        # Session seeds are derived from the server seed, so a whole
+        # server run can be reproduced
+        self.seed = rd.getrandbits(64) if seed is None else seed
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.history_size = history_size
+        self.max_size = max_size
+        self.sessions = 0
+        self.started = 0
+        self._server = None
+
+    def new_game(self, size=None, seed=None):
+        """Creates the game of a session."""
+        if seed is None:
+            _, seed = spawn.splitmix64(self.seed + self.started)
+        return GameBoard(size or self.size, self.win, bitboard=True,
+                         compact=True, seed=seed,
+                         history_size=self.history_size)
+
+    async def start(self, host='127.0.0.1', port=2048, path=None):
+        """Starts listening on a TCP port, or on a Unix socket path."""
+        if path:
+            self._server = await asyncio.start_unix_server(
+                self.handle, path, limit=LINE_LIMIT)
+        else:
+            self._server = await asyncio.start_server(
+                self.handle, host, port, limit=LINE_LIMIT)
+        return self._server
+
+    async def close(self):
+        """Stops listening for new connections."""
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def handle(self, reader, writer):
+        """Runs the session of a connection."""
+        if self.sessions >= self.max_sessions:
+            await self._send(writer, {'error': 'Too many sessions'})
+            writer.close()
+            return
+        self.sessions += 1
+        self.started += 1
+        game = self.new_game()
+        try:
+            await self._send(writer, game_state(game))
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(),
+                                                  self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self._send(writer, {'error': 'Idle timeout'})
+                    break
+                except ValueError:
+                    # The line was longer than LINE_LIMIT
+                    await self._send(writer, {'error': 'Line too long'})
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    action = request['action']
+                    if action == 'quit':
+                        break
+                    game = await self._apply(game, action, request)
+                    reply = game_state(game)
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {'error': f'Invalid request: {error}'}
+                await self._send(writer, reply)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def _apply(self, game, action, request):
+        """Performs an action, returning the game to keep playing."""
+        if action == 'new':
+            size = request.get('size')
+            if size is not None and (type(size) is not int
+                                     or not 0 < size <= self.max_size):
+                raise ValueError(f'size must be an integer from 1 to '
+                                 f'{self.max_size}')
+            self.started += 1
+            return self.new_game(size, request.get('seed'))
+        elif action == 'shift':
+            direction = DIRECTIONS[request['direction']]
+            if game.size >= VECTOR_SIZE:
+                # Big boards are shifted in a worker thread to keep the
+                # event loop responsive
+                await asyncio.get_running_loop().run_in_executor(
+                    None, game.shift, direction)
+            else:
+                game.shift(direction)
+        elif action == 'undo':
+            game.undo()
+        elif action == 'redo':
+            game.redo()
+        elif action != 'state':
+            raise ValueError(f'unknown action {action!r}')
+        return game
+
+    async def _send(self, writer, message):
+        """Writes a message, waiting until the client can take more."""
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+
+
+class Client:
+    """Minimal client of a GameServer, mostly for tests and scripts."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=2048, path=None):
+        """Connects to a server and returns the client and first state."""
+        if path:
+            streams = await asyncio.open_unix_connection(path)
+        else:
+            streams = await asyncio.open_connection(host, port)
+        client = cls(*streams)
+        return client, await client.receive()
+
+    async def request(self, action, **arguments):
+        """Sends an action and returns the reply."""
+        message = dict(arguments, action=action)
+        self.writer.write(json.dumps(message).encode() + b'\n')
+        await self.writer.drain()
+        return await self.receive()
+
+    async def receive(self):
+        """Reads the next message of the server."""
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+    async def close(self):
+        """Ends the session."""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def serve(server, host, port, path):
+    """Runs a server until it's cancelled."""
+    listener = await server.start(host, port, path)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m 2048 serve',
+        description='Host games for clients over TCP or a Unix socket.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on')
+    parser.add_argument('--port', type=int, default=2048,
+                        help='TCP port to listen on')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--size', type=int, default=4,
+                        help='default size of the boards')
+    parser.add_argument('--win', type=int, default=2048,
+                        help='cell number needed to win')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed the session seeds are derived from')
+    parser.add_argument('--idle-timeout', type=float, default=300.0,
+                        help='seconds before idle sessions are closed')
+    parser.add_argument('--max-sessions', type=int, default=20000,
+                        help='maximum number of concurrent sessions')
+    parser.add_argument('--history', type=int, default=100,
+                        help='undo steps kept per session')
+    parser.add_argument('--max-size', type=int, default=64,
+                        help='biggest board size clients can ask for')
+    args = parser.parse_args(argv)
+    if not 0 < args.size <= args.max_size:
+        parser.error('--size must be between 1 and --max-size')
+    server = GameServer(args.size, args.win, args.seed, args.idle_timeout,
+                        args.max_sessions, args.history, args.max_size)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import numpy as np
+
+    async def test():
+        server = GameServer(seed=1, max_sessions=200)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        # Many concurrent sessions play their own games
+        connections = await asyncio.gather(*(Client.connect(port=port)
+                                             for i in range(200)))
+        assert server.sessions == 200
+        clients = [client for client, _ in connections]
+        refused, state = await Client.connect(port=port)
+        assert state == {'error': 'Too many sessions'}
+        await refused.close()
+        for direction in ('l', 'u', 'right', 'down'):
+            states = await asyncio.gather(*(
+                client.request('shift', direction=direction)
+                for client in clients))
+        assert len({str(state['board']) for state in states}) > 1
+        # Seeded sessions play like local games
+        client = clients[0]
+        state = await client.request('new', seed=42, size=5)
+        game = GameBoard(5, seed=42)
+        assert state['board'] == game.board.tolist()
+        for direction in 'lurdlurd':
+            state = await client.request('shift', direction=direction)
+            game.shift(DIRECTIONS[direction])
+        assert state['board'] == game.board.tolist()
+        assert state['score'] == game.score
+        state = await client.request('undo')
+        game.undo()
+        assert np.array_equal(state['board'], game.board)
+        assert 'error' in await client.request('shift', direction='x')
+        assert 'error' in await client.request('jump')
+        # Board sizes are limited
+        for size in (20000, 0, -4, 5.0, True, '5'):
+            assert 'error' in await client.request('new', size=size)
+        state = await client.request('state')
+        assert state['board'] == game.board.tolist()
+        state = await client.request('new', size=server.max_size)
+        assert len(state['board']) == server.max_size
+        # Sessions end when clients quit
+        for client in clients:
+            client.writer.write(b'{"action": "quit"}\n')
+            assert (await client.receive()) is None
+            await client.close()
+        assert server.sessions == 0
+        await server.close()
+        # Idle sessions are closed
+        server = GameServer(idle_timeout=0.2)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        client, _ = await Client.connect(port=port)
+        await asyncio.sleep(0.4)
+        assert (await client.receive()) == {'error': 'Idle timeout'}
+        assert (await client.receive()) is None
+        assert server.sessions == 0
+        await client.close()
+        await server.close()
+
+    asyncio.run(test())
+    print('All tests passed.')
@@ -0,0 +1,118 @@
+import mmap
+import struct
+import numpy as np
+from .board import GameBoard
+
+# A snapshot file starts with MAGIC, followed by the GameBoard snapshots
+# one after the other, the offsets of every snapshot and of the end of the
+# last one as uint64, and a FOOTER with the offset of that index and the
+# number of snapshots. Reading the footer first gives random access to any
+# snapshot without scanning the file.
+MAGIC = b'2048SNB\x01'
+FOOTER = struct.Struct('<QQ')
+
+
+class SnapshotWriter:
+    """Writes many game snapshots into a single file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._offsets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, game: GameBoard):
+        """Adds a snapshot of a game and returns its index."""
+        self._offsets.append(self._file.tell())
+        self._file.write(game.to_bytes())
+        return len(self._offsets) - 1
+
+    def close(self):
+        """Writes the index and closes the file."""
+        end = self._file.tell()
+        offsets = np.array(self._offsets + [end], dtype='<u8')
+        self._file.write(offsets.tobytes())
+        self._file.write(FOOTER.pack(end, len(self._offsets)))
+        self._file.close()
+
+
+class SnapshotFile:
+    """Memory-mapped reader of a snapshot file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(self._data) < len(MAGIC) + FOOTER.size
+                or self._data[:len(MAGIC)] != MAGIC):
+            self.close()
+            raise ValueError(f'{path} is not a snapshot file')
+        index, count = FOOTER.unpack_from(self._data,
+                                          len(self._data) - FOOTER.size)
+        self._offsets = np.frombuffer(self._data, '<u8', count + 1, index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        """Restores the game of a snapshot."""
+        if not -len(self) <= index < len(self):
+            raise IndexError('Snapshot index out of range')
+        index %= len(self)
+        start, end = self._offsets[index:index + 2]
+        return GameBoard.from_bytes(self._data[start:end])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._offsets = None
+        self._data.close()
+        self._file.close()
+
+
+# Run tests if executed as script
+if __name__ == '__main__':
+    import os
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'games.snb')
+    rng = np.random.default_rng(18)
+    # Checkpoint a game every few moves
+    game = GameBoard(seed=18, bitboard=True, history_size=10)
+    boards = []
+    with SnapshotWriter(path) as writer:
+        for i in range(200):
+            game.shift(rng.integers(0, 4))
+            if i % 2 == 0:
+                assert writer.append(game) == len(boards)
+                boards.append((game.board.copy(), game.score, game.moves))
+    # Read them back in any order
+    with SnapshotFile(path) as snapshots:
+        assert len(snapshots) == len(boards) == 100
+        for i in rng.permutation(len(boards)):
+            restored = snapshots[i]
+            board, score, moves = boards[i]
+            assert np.array_equal(restored.board, board)
+            assert restored.score == score and restored.moves == moves
+        assert snapshots[-1].moves == boards[-1][2]
+        assert sum(1 for _ in snapshots) == 100
+        try:
+            snapshots[100]
+            assert False
+        except IndexError:
+            pass
+    print('All tests passed.')
@@ -0,0 +1,151 @@
+import random as rd
+import numpy as np
+
+# Seeded spawns use SplitMix64, a tiny counter-based generator that can be
+# advanced one board at a time (GameBoard) or for a whole array of boards
+# at once (BatchBoard) with identical results.
+MASK64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+MIX1 = 0xBF58476D1CE4E5B9
+MIX2 = 0x94D049BB133111EB
+
+# New cells are a 2 or a 4 with equal probability
+DISTRIBUTION = ((2, 0.5), (4, 0.5))
+
+
+class Spawner:
+    """Chooses where new cells appear and which number they get.
+
+    Spawners pick directly among the blank cells of the board, given as
+    flat indices (row * size + col) in row-major order.
+    """
+
+    distribution = DISTRIBUTION
+
+    def spawn(self, empty):
+        """Returns the (flat index, number) of the next new cell."""
+        raise NotImplementedError
+
+
+class SeededSpawner(Spawner):
+    """Spawns cells with a SplitMix64 generator, like BatchBoard does."""
+
+    def __init__(self, seed, distribution=DISTRIBUTION):
+        self.distribution = check_distribution(distribution)
+        self.state = seed & MASK64
+
+    def spawn(self, empty):
+        self.state, output = splitmix64(self.state)
+        position, value = pick(output, len(empty), self.distribution)
+        return int(empty[position]), value
+
+
+class RandomSpawner(Spawner):
+    """Spawns cells with a random.Random generator."""
+
+    def __init__(self, rng=None, distribution=DISTRIBUTION):
+        self.distribution = check_distribution(distribution)
+        self.rng = rng or rd.Random()
+
+    def spawn(self, empty):
+        index = int(empty[self.rng.randrange(len(empty))])
+        return index, _choose_number(self.distribution, self.rng.random())
+
+
+class RecordingSpawner(Spawner):
+    """Wraps another spawner and keeps the list of spawned cells."""
+
+    def __init__(self, spawner):
+        self.spawner = spawner
+        self.distribution = spawner.distribution
+        self.spawns = []
+
+    def spawn(self, empty):
+        cell = self.spawner.spawn(empty)
+        self.spawns.append(cell)
+        return cell
+
+
+class ReplaySpawner(Spawner):
+    """Spawns a recorded sequence of (flat index, number) cells."""
+
+    def __init__(self, spawns, distribution=DISTRIBUTION):
+        self.distribution = check_distribution(distribution)
+        self._spawns = iter(spawns)
+
+    def spawn(self, empty):
+        try:
+            index, value = next(self._spawns)
+        except StopIteration:
+            raise ValueError('The recorded spawn sequence ran out') from None
+        if index not in empty:
+            raise ValueError(f'Recorded spawn at cell {index} is not blank')
+        return index, value
+
+
+def check_distribution(distribution):
+    """Validates a sequence of (number, probability) pairs."""
+    distribution = tuple((int(value), float(probability))
+                         for value, probability in distribution)
+    if not distribution or abs(sum(p for _, p in distribution) - 1) > 1e-9:
+        raise ValueError('Spawn probabilities must add up to 1')
+    return distribution
+
+
+def splitmix64(state):
+    """Advances a SplitMix64 state.
+
+    Returns:
+        A tuple with the new state and the 64-bit random output.
+    """
+    state = (state + GOLDEN_GAMMA) & MASK64
+    z = state
+    z = ((z ^ (z >> 30)) * MIX1) & MASK64
+    z = ((z ^ (z >> 27)) * MIX2) & MASK64
+    return state, z ^ (z >> 31)
+
+
+def splitmix64_array(states):
+    """Advances an array of SplitMix64 states (uint64) at once."""
+    states = states + np.uint64(GOLDEN_GAMMA)
+    z = states
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(MIX2)
+    return states, z ^ (z >> np.uint64(31))
+
+
+def pick(output, empty_count, distribution=DISTRIBUTION):
+    """Turns a random output into a spawn among the blank cells.
+
+    The high 32 bits of the output choose the cell and the low 32 bits
+    choose the number.
+
+    Args:
+        output: 64-bit random number (or array of them).
+        empty_count: Number of blank cells (or array of them).
+        distribution: Sequence of (number, probability) pairs.
+
+    Returns:
+        A tuple with the position among the blank cells, in row-major
+        order, and the number to place there.
+    """
+    if isinstance(output, np.ndarray):
+        position = ((output >> np.uint64(32)) * empty_count.astype(np.uint64)
+                    >> np.uint64(32)).astype(np.int64)
+        uniform = (output & np.uint64(0xFFFFFFFF)) / 2**32
+        numbers = np.array([value for value, _ in distribution])
+        limits = np.cumsum([probability for _, probability in distribution])
+        choice = np.searchsorted(limits, uniform, side='right')
+        return position, numbers[np.minimum(choice, len(numbers) - 1)]
+    position = ((output >> 32) * empty_count) >> 32
+    return position, _choose_number(distribution, (output & 0xFFFFFFFF) / 2**32)
+
+
+def _choose_number(distribution, uniform):
+    """Chooses a number of the distribution given a uniform in [0, 1)."""
+    limit = 0.0
+    for value, probability in distribution:
+        limit += probability
+        if uniform < limit:
+            return value
+    return distribution[-1][0]